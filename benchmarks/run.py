@@ -0,0 +1,290 @@
+"""Benchmarks of the query-backed fields and of form generation.
+
+Each benchmark runs against synthetic models in an in-memory SQLite
+database, at several table sizes, and reports the minimum, median and mean
+time of its repetitions. Results can be saved as JSON and compared with an
+earlier run::
+
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --compare before.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from datetime import timezone
+
+import sqlalchemy
+import wtforms
+from sqlalchemy import create_engine
+from sqlalchemy import ForeignKey
+from sqlalchemy import types as sqla_types
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import Column
+from wtforms import Form
+
+from wtforms_sqlalchemy.fields import get_pk_from_identity
+from wtforms_sqlalchemy.fields import QuerySelectField
+from wtforms_sqlalchemy.fields import QuerySelectMultipleField
+from wtforms_sqlalchemy.orm import model_form
+
+FORMAT_VERSION = 1
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+WIDE_COLUMNS = 100
+SELECTED = 100
+
+Model = declarative_base()
+
+
+class Item(Model):
+    __tablename__ = "item"
+    id = Column(sqla_types.Integer, primary_key=True)
+    name = Column(sqla_types.String(50), nullable=False)
+    category = Column(sqla_types.String(20), nullable=False)
+
+
+class Owner(Model):
+    __tablename__ = "owner"
+    id = Column(sqla_types.Integer, primary_key=True)
+    item_id = Column(sqla_types.Integer, ForeignKey(Item.id), nullable=False)
+
+
+def _wide_model():
+    """A model with many columns of various types, for form generation."""
+    types = [
+        sqla_types.Integer,
+        sqla_types.String(50),
+        sqla_types.Text,
+        sqla_types.Boolean,
+        sqla_types.Date,
+        sqla_types.DateTime,
+        sqla_types.Numeric(10, 2),
+    ]
+    attrs = {
+        "__tablename__": "wide",
+        "id": Column(sqla_types.Integer, primary_key=True),
+    }
+    for i in range(WIDE_COLUMNS):
+        attrs[f"column_{i}"] = Column(types[i % len(types)], nullable=bool(i % 2))
+    return type("Wide", (Model,), attrs)
+
+
+Wide = _wide_model()
+
+
+def _session(rows):
+    engine = create_engine("sqlite://")
+    Model.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            Item.__table__.insert(),
+            [
+                {"id": i, "name": f"item {i}", "category": f"category {i % 20}"}
+                for i in range(1, rows + 1)
+            ],
+        )
+    return Session(engine)
+
+
+def bench_render(session, rows):
+    class F(Form):
+        item = QuerySelectField(
+            get_label="name", query_factory=lambda: session.query(Item)
+        )
+
+    def run():
+        F(item=session.get(Item, rows)).item()
+        session.expunge_all()
+
+    return run
+
+
+def bench_render_groups(session, rows):
+    class F(Form):
+        item = QuerySelectField(
+            get_label="name",
+            get_group="category",
+            query_factory=lambda: session.query(Item),
+        )
+
+    def run():
+        F().item()
+        session.expunge_all()
+
+    return run
+
+
+def bench_resolve(session, rows, **kwargs):
+    class F(Form):
+        item = QuerySelectField(
+            get_label="name", query_factory=lambda: session.query(Item), **kwargs
+        )
+
+    formdata = _PostData(item=[str(rows // 2)])
+
+    def run():
+        assert F(formdata).item.data is not None
+        session.expunge_all()
+
+    return run
+
+
+def bench_resolve_pk_lookup(session, rows):
+    return bench_resolve(session, rows, pk_lookup=True)
+
+
+def bench_validate_multiple(session, rows):
+    class F(Form):
+        items = QuerySelectMultipleField(
+            get_label="name", query_factory=lambda: session.query(Item)
+        )
+
+    step = max(rows // SELECTED, 1)
+    selected = session.query(Item).filter(Item.id % step == 0).limit(SELECTED).all()
+
+    def run():
+        assert F(items=selected).validate()
+
+    return run
+
+
+def bench_get_pk(session, rows):
+    objects = session.query(Item).all()
+
+    def run():
+        for obj in objects:
+            get_pk_from_identity(obj)
+
+    return run
+
+
+def bench_model_form(session, rows):
+    def run():
+        model_form(Wide, session)
+        model_form(Owner, session)
+
+    return run
+
+
+BENCHMARKS = {
+    "render": bench_render,
+    "render_groups": bench_render_groups,
+    "resolve": bench_resolve,
+    "resolve_pk_lookup": bench_resolve_pk_lookup,
+    "validate_multiple": bench_validate_multiple,
+    "get_pk_from_identity": bench_get_pk,
+    "model_form": bench_model_form,
+}
+
+# Benchmarks which do not depend on the number of rows only run once.
+SIZE_INDEPENDENT = {"model_form"}
+
+
+class _PostData(dict):
+    def getlist(self, key):
+        return self[key]
+
+
+def _measure(run, repeat):
+    run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+    }
+
+
+def run_benchmarks(names, sizes, repeat):
+    results = []
+    for rows in sizes:
+        session = _session(rows)
+        try:
+            for name in names:
+                if name in SIZE_INDEPENDENT and rows != sizes[0]:
+                    continue
+                timings = _measure(BENCHMARKS[name](session, rows), repeat)
+                result = {"name": name, "rows": rows, "repeat": repeat, **timings}
+                results.append(result)
+                _print_result(result)
+        finally:
+            session.close()
+            session.bind.dispose()
+    return results
+
+
+def _metadata():
+    return {
+        "format": FORMAT_VERSION,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "wtforms": wtforms.__version__,
+    }
+
+
+def _print_result(result, baseline=None):
+    milliseconds = result["min"] * 1e3
+    line = f"{result['name']:<22} {result['rows']:>8} rows  {milliseconds:10.3f} ms"
+    if baseline is not None:
+        line += f"  {result['min'] / baseline['min']:6.2f}x"
+    print(line)
+
+
+def _compare(results, path):
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get("format") != FORMAT_VERSION:
+        sys.exit(f"{path} was saved in an unsupported format.")
+    previous = {(r["name"], r["rows"]): r for r in baseline["results"]}
+    print(f"\nCompared with {path} (minimum times, lower ratios are faster):")
+    for result in results:
+        _print_result(result, previous.get((result["name"], result["rows"])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "names",
+        nargs="*",
+        metavar="name",
+        help=f"benchmarks to run, all of them by default: {', '.join(BENCHMARKS)}",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="numbers of rows of the choice table",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    parser.add_argument("--compare", help="compare with results saved by --output")
+    args = parser.parse_args(argv)
+
+    names = args.names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}")
+    results = run_benchmarks(names, sorted(args.sizes), args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({**_metadata(), "results": results}, f, indent=2)
+    if args.compare:
+        _compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Caches for sharing the choices of query-backed fields between forms."""
+
+import itertools
+import threading
+import time
+from abc import ABC
+from abc import abstractmethod
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy import inspect as sainspect
+from sqlalchemy.orm import Session
+
+__all__ = (
+    "ChoiceCache",
+    "MemoryChoiceCache",
+    "ChoiceCacheInvalidator",
+)
+
+
+class ChoiceCache(ABC):
+    """Abstract base class for choice cache backends.
+
+    A choice cache stores the precomputed options of a
+    :class:`~wtforms_sqlalchemy.fields.QuerySelectField`, as a picklable
+    sequence of ``(pk, label, group, render_kw)`` tuples, under the field's
+    `cache_key`. Backends only need to implement these four abstract methods,
+    so a wrapper around an external cache can be used as long as it can store
+    such sequences.
+
+    :meth:`track` and :meth:`invalidate_models` support invalidating values
+    when the rows they were loaded from change. Backends which do not keep
+    track of models can leave them alone, in which case any change clears the
+    whole cache.
+    """
+
+    @abstractmethod
+    def get(self, key):
+        """Return the value stored for `key`, or `None` if there is none or it
+        has expired."""
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        """Store `value` for `key`. If `ttl` is given, it is the number of
+        seconds after which the value expires, and overrides the default of
+        the backend."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove the value stored for `key`, if any."""
+
+    @abstractmethod
+    def clear(self):
+        """Remove every stored value."""
+
+    def track(self, key, models):  # noqa: B027
+        """Record that the value stored for `key` was loaded from the mapped
+        classes `models`. Backends which do not keep track of models do
+        nothing."""
+
+    def invalidate_models(self, models):
+        """Remove the values loaded from any of the mapped classes `models`."""
+        self.clear()
+
+
+class MemoryChoiceCache(ChoiceCache):
+    """Thread-safe in-process choice cache.
+
+    At most `maxsize` keys are kept, the least recently used ones being
+    evicted first. If `ttl` is set, values expire after that many seconds.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._entries = OrderedDict()
+        self._model_keys = {}
+        self._key_models = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= self.timer():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        expires = None if ttl is None else self.timer() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._model_keys.clear()
+            self._key_models.clear()
+
+    def track(self, key, models):
+        with self._lock:
+            if key not in self._entries:
+                return
+            for model in models:
+                self._model_keys.setdefault(model, set()).add(key)
+                self._key_models.setdefault(key, set()).add(model)
+
+    def invalidate_models(self, models):
+        with self._lock:
+            for model in models:
+                for key in list(self._model_keys.get(model, ())):
+                    self._drop(key)
+
+    def _drop(self, key):
+        """Remove `key` and its model tracking, with the lock held."""
+        self._entries.pop(key, None)
+        for model in self._key_models.pop(key, ()):
+            keys = self._model_keys[model]
+            keys.discard(key)
+            if not keys:
+                del self._model_keys[model]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ChoiceCacheInvalidator:
+    """Invalidates the values of a :class:`ChoiceCache` when rows of the
+    models they were loaded from are inserted, updated or deleted.
+
+    Changes are collected when a session flushes and applied to the cache once
+    its transaction commits; they are discarded if it is rolled back.
+    Modifications made without the unit of work, such as bulk updates, are not
+    detected.
+
+    ::
+
+        invalidator = ChoiceCacheInvalidator(choice_cache)
+        invalidator.listen(Session)
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def listen(self, target=Session):
+        """Start listening to the events of `target`, which can be anything
+        accepting session events, such as a `Session` class, a `sessionmaker`
+        or a `Session` instance."""
+        for name, listener in self._listeners():
+            event.listen(target, name, listener)
+
+    def remove(self, target=Session):
+        """Stop listening to the events of `target`."""
+        for name, listener in self._listeners():
+            event.remove(target, name, listener)
+
+    def _listeners(self):
+        return (
+            ("after_flush", self._after_flush),
+            ("after_commit", self._after_commit),
+            ("after_transaction_end", self._after_transaction_end),
+        )
+
+    def _after_flush(self, session, flush_context):
+        models = session.info.setdefault(self, set())
+        for obj in itertools.chain(session.new, session.dirty, session.deleted):
+            # Queries on a base class also select the rows of its subclasses.
+            for mapper in sainspect(obj).mapper.iterate_to_root():
+                models.add(mapper.class_)
+
+    def _after_commit(self, session):
+        models = session.info.pop(self, None)
+        if models:
+            self.cache.invalidate_models(models)
+
+    def _after_transaction_end(self, session, transaction):
+        if transaction.parent is None:
+            session.info.pop(self, None)
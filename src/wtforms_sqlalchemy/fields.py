@@ -1,25 +1,50 @@
 """Useful form fields for use with SQLAlchemy ORM."""
 
+import asyncio
+import itertools
 import operator
+import time
+import uuid
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 
+from markupsafe import Markup
+from sqlalchemy import and_
+from sqlalchemy import cast
+from sqlalchemy import func
+from sqlalchemy import inspect as sainspect
+from sqlalchemy import literal
+from sqlalchemy import null
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import String
+from sqlalchemy import union_all
+from sqlalchemy.orm import ColumnProperty
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import Query
+from sqlalchemy.orm import RelationshipProperty
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import undefer
+from sqlalchemy.orm.attributes import QueryableAttribute
+from sqlalchemy.sql.expression import ColumnElement
 from wtforms import widgets
 from wtforms.fields import SelectFieldBase
 from wtforms.validators import ValidationError
 
-try:
-    from sqlalchemy.orm.util import identity_key
-
-    has_identity_key = True
-except ImportError:
-    has_identity_key = False
-
+from . import instrumentation
 
 __all__ = (
     "QuerySelectField",
     "QuerySelectMultipleField",
+    "QuerySearchSelectField",
     "QueryRadioField",
     "QueryCheckboxField",
+    "AsyncQuerySelectField",
+    "AsyncQuerySelectMultipleField",
+    "load_form_choices",
+    "prefetch_choices",
+    "batch_load_choices",
 )
 
 
@@ -34,7 +59,9 @@ class QuerySelectField(SelectFieldBase):
     for those composed of string, unicode, and integer types. For the most
     part, the primary keys will be auto-detected from the model, alternately
     pass a one-argument callable to `get_pk` which can return a unique
-    comparable key.
+    comparable key. The `data` of the field is matched to the options by this
+    key, and the options and their groups are computed once per list of
+    query results, however many times the field is rendered.
 
     The `query` property on the field can be set from within a view to assign
     a query per-instance to the field. If the property is not set, the
@@ -56,17 +83,91 @@ class QuerySelectField(SelectFieldBase):
     will be used as both the grouping key and the display label in the `select`
     options.
 
+    `get_group` can also be a column attribute of the model, such as
+    ``Model.category``. The query is then ordered by that column, and by the
+    `get_label` column if it is a column name, before its own ``ORDER BY``,
+    and streamed options are grouped as they come, without bucketing them
+    first. Pass `order_groups` to enable or disable this; it is only enabled
+    by default for column attributes. Queries with a ``LIMIT`` or ``OFFSET``
+    are left as they are, and queries which are not a sqlalchemy `Query` on a
+    model must already be ordered by group. Other SQL expressions, such as
+    table columns or functions, are not supported as `get_group`.
+
     Specify `get_render_kw` to apply HTML attributes to each option. If a
     string, this is the name of an attribute on the model containing a
     dictionary.  If a one-argument callable, this callable will be passed the
     model instance and expected to return a dictionary.  Otherwise, an empty
     dictionary will be used.
 
+    When `get_label`, `get_group` or `get_render_kw` are attribute names,
+    they can be dotted paths such as ``"category.name"``. If the query is a
+    sqlalchemy `Query` on a model, the relationships these paths go through
+    are then loaded along with the options, with ``joinedload`` for those
+    referring to a single object and ``selectinload`` for collections, and
+    deferred columns are undeferred, instead of being loaded for each option.
+    Set `eager_load` to `False` to keep the loader options of the query as
+    they are.
+
     If `allow_blank` is set to `True`, then a blank choice will be added to the
     top of the list. Selecting this choice will result in the `data` property
     being `None`. The label for this blank choice can be set by specifying the
     `blank_text` parameter. The value for this blank choice can be set by
     specifying the `blank_value` parameter (default: `__None`).
+
+    If `pk_lookup` is set to `True` and the query is a sqlalchemy `Query` on a
+    single model, submitted values are resolved and validated with one
+    ``WHERE pk IN (...)`` query built from the field's query, so its filters
+    still apply. The full choice list is then only loaded when the field is
+    rendered. This requires `get_pk` to return the model's primary key, which
+    is the case for the default implementation. Queries with a ``LIMIT`` or
+    ``OFFSET``, which would apply before the primary key filter, are run as
+    they are and their results are searched instead.
+
+    To share the options between forms, pass a
+    :class:`~wtforms_sqlalchemy.cache.ChoiceCache` as `choice_cache` along with
+    a `cache_key` identifying the query. The labels, groups and HTML
+    attributes of the options are then computed once and stored in the cache,
+    optionally for `cache_ttl` seconds, and rendering the field does not run
+    the query while they are cached. Submitted values are resolved with a
+    primary key query in that case, as with `pk_lookup`.
+
+    The cache records the model the options were loaded from, so they can be
+    invalidated when its rows change, see
+    :class:`~wtforms_sqlalchemy.cache.ChoiceCacheInvalidator`. The model is
+    taken from the query if it is a sqlalchemy `Query`, and can otherwise be
+    given as `model`.
+
+    Changes made by other processes can be detected by setting
+    `cache_version` to a cheap probe of the rows, run each time cached
+    options are used, which are only reloaded when its result changes. It is
+    either a SQL expression, or a list of them, selected with the filters of
+    the query, such as ``(func.count(), func.max(Model.updated_at))``, or a
+    callable receiving the query and returning a comparable token. The
+    expressions are selected without the ``LIMIT`` and ``OFFSET`` of the
+    query, so a change to any row matching its filters is detected.
+
+    The query can also select only some columns of a model, such as
+    ``session.query(Model.id, Model.name)``, in which case the options are
+    rendered from the resulting rows, and only the selected objects are loaded
+    with a primary key query. `get_pk`, `get_label`, `get_group` and
+    `get_render_kw` then have to work with both the rows and the objects, for
+    instance by being attribute names.
+
+    If `yield_per` is set, options are rendered while the query results are
+    fetched in batches of that size, with `Query.yield_per` for sqlalchemy
+    queries, and the objects are not kept afterwards. Submitted values are then
+    resolved with a primary key query as with `pk_lookup`, and rendering the
+    field twice runs the query twice. The choice cache takes precedence over
+    this mode when it is configured.
+
+    The options are stored as parallel lists rather than a tuple per option,
+    but by default the objects loaded from the query and their primary key
+    index are kept along with them, so this alone does not use less memory.
+    If `keep_objects` is set to `False`, the objects are released once the
+    options are computed, and only the selected ones are kept, as submitted
+    values are resolved with a primary key query as with `pk_lookup`. This
+    saves memory for large option lists at the cost of that query. Async
+    fields always keep the objects.
     """
 
     widget = widgets.Select()
@@ -83,16 +184,38 @@ class QuerySelectField(SelectFieldBase):
         allow_blank=False,
         blank_text="",
         blank_value="__None",
+        pk_lookup=False,
+        choice_cache=None,
+        cache_key=None,
+        cache_ttl=None,
+        model=None,
+        yield_per=None,
+        order_groups=None,
+        eager_load=True,
+        keep_objects=True,
+        cache_version=None,
         **kwargs,
     ):
         super().__init__(label, validators, **kwargs)
         self.query_factory = query_factory
 
+        if isinstance(get_group, QueryableAttribute):
+            if order_groups is None:
+                order_groups = isinstance(get_group.property, ColumnProperty)
+            get_group = get_group.key
+        elif isinstance(get_group, ColumnElement):
+            raise TypeError(
+                "get_group must be an attribute name, a column attribute of the "
+                f"model or a callable, not {get_group!r}."
+            )
+
+        # The attribute names given for these, if any, tell which columns
+        # the options are computed from.
+        self._label_spec = get_label
+        self._group_spec = get_group
+        self._render_kw_spec = get_render_kw
+
         if get_pk is None:
-            if not has_identity_key:
-                raise Exception(
-                    "The sqlalchemy identity_key function could not be imported."
-                )
             self.get_pk = get_pk_from_identity
         else:
             self.get_pk = get_pk
@@ -123,56 +246,361 @@ class QuerySelectField(SelectFieldBase):
         self.allow_blank = allow_blank
         self.blank_text = blank_text
         self.blank_value = blank_value
+        self.pk_lookup = pk_lookup
+        self.choice_cache = choice_cache
+        self.cache_key = cache_key
+        self.cache_ttl = cache_ttl
+        self.cache_version = cache_version
+        self.model = model
+        self.yield_per = yield_per
+        self.order_groups = bool(order_groups) and self._has_groups
+        self.eager_load = eager_load
+        self.keep_objects = keep_objects
+        self._loader_options = None
         self.query = None
         self._object_list = None
+        self._group_buckets = None
+        self._data_from_choices = False
+        self._invalid_formdata = False
+
+    @property
+    def _object_list(self):
+        return self._loaded_object_list
+
+    @_object_list.setter
+    def _object_list(self, value):
+        # The primary key index and the choices are derived from the object
+        # list, so they have to be rebuilt whenever it is replaced or reset.
+        self._loaded_object_list = value
+        self._object_index = None
+        self._projected = False
+        self._detached = False
+        self._choices = None
 
     def _get_data(self):
-        if self._formdata is not None:
-            for pk, obj in self._get_object_list():
-                if pk == self._formdata:
-                    self._set_data(obj)
-                    break
+        formdata = self._formdata
+        if formdata is not None:
+            for _, obj in self._find_objects([formdata]):
+                self._set_data(obj)
+                self._data_from_choices = True
+                break
+            else:
+                # Remember the failed lookup rather than running it again.
+                self._formdata = None
+                self._invalid_formdata = bool(formdata)
         return self._data
 
     def _set_data(self, data):
         self._data = data
         self._formdata = None
+        self._data_from_choices = False
+        self._invalid_formdata = False
 
     data = property(_get_data, _set_data)
 
-    def _get_object_list(self):
+    def _get_query(self):
+        query = self.query if self.query is not None else self.query_factory()
+        if self.order_groups:
+            query = self._order_by_group(query)
+        return query
+
+    def _order_by_group(self, query):
+        """Order a `Query` by the group column, then the label column, then
+        its own order. Queries with a LIMIT or OFFSET cannot be reordered."""
+        entity = _query_entity(query)
+        if entity is None or _is_limited(query):
+            return query
+        mapper = sainspect(entity).mapper
+        order = []
+        for spec in (self._group_spec, self._label_spec):
+            if not isinstance(spec, str) or spec not in mapper.column_attrs:
+                break
+            order.append(getattr(entity, spec))
+        if not order:
+            return query
+        return query.order_by(None).order_by(*order, *query._order_by_clauses)
+
+    def _get_model(self, query=None):
+        """Return the mapped class the choices are loaded from, if known."""
+        if self.model is not None:
+            return self.model
+        if query is None:
+            query = self._get_query()
+        entity = _query_entity(query)
+        return None if entity is None else sainspect(entity).mapper.class_
+
+    def _get_object_list(self, query=None):
         if self._object_list is None:
-            query = self.query if self.query is not None else self.query_factory()
-            get_pk = self.get_pk
-            self._object_list = list((str(get_pk(obj)), obj) for obj in query)
+            if query is None:
+                query = self._get_query()
+            self._object_list = self._load_object_list(query)
+            self._projected = _is_projection(query)
         return self._object_list
 
+    def _load_object_list(self, query):
+        if instrumentation._listeners:
+            start = time.perf_counter()
+        object_list = list(self._iter_objects(query))
+        if instrumentation._listeners:
+            seconds = time.perf_counter() - start
+            instrumentation._notify("choices_loaded", self, seconds, len(object_list))
+        return object_list
+
+    def _load_choices(self, query):
+        """Compute the choices from the results of `query`, without keeping
+        the objects."""
+        if instrumentation._listeners:
+            start = time.perf_counter()
+        choices = _ChoiceList(self._make_choices(self._iter_objects(query)))
+        if instrumentation._listeners:
+            seconds = time.perf_counter() - start
+            instrumentation._notify("choices_loaded", self, seconds, len(choices))
+        return choices
+
+    def _iter_objects(self, query):
+        """Yield the ``(pk, obj)`` pairs of the results of `query`."""
+        query = self._with_loader_options(query)
+        get_pk = self.get_pk
+        for obj in query:
+            yield str(get_pk(obj)), obj
+
+    def _with_loader_options(self, query):
+        """Add loader options to a `Query` on a whole model, so the attributes
+        named by `get_label`, `get_group` and `get_render_kw` are loaded along
+        with the objects."""
+        if not self.eager_load or _is_projection(query):
+            return query
+        entity = _query_entity(query)
+        if entity is None:
+            return query
+        if self._loader_options is None or self._loader_options[0] is not entity:
+            options = _loader_options(
+                entity, (self._label_spec, self._group_spec, self._render_kw_spec)
+            )
+            self._loader_options = (entity, options)
+        options = self._loader_options[1]
+        return query.options(*options) if options else query
+
+    def _get_object_index(self, query=None):
+        """Map each primary key string of the object list, loaded from `query`
+        if given, to its position."""
+        object_list = self._get_object_list(query)
+        if self._object_index is None:
+            index = {}
+            for position, (pk, _) in enumerate(object_list):
+                index.setdefault(pk, position)
+            self._object_index = index
+        return self._object_index
+
+    def _find_objects(self, pks):
+        """Return the ``(pk, obj)`` choices matching the primary key strings
+        `pks`, in query order."""
+        query = None
+        # Detached objects, loaded in another session, are not returned as
+        # they could not be added to the session of the query.
+        if self._object_list is None or self._projected or self._detached:
+            # The query is only built once, `query_factory` may run it.
+            query = self._get_query()
+            if (
+                self._projected
+                or self._detached
+                or self._prefers_lookup()
+                or _is_projection(query)
+            ):
+                objects = self._lookup_objects(pks, query)
+                if objects is not None:
+                    return objects
+
+        index = self._get_object_index(query)
+        object_list = self._object_list
+        return [object_list[i] for i in sorted(index[pk] for pk in pks if pk in index)]
+
+    def _prefers_lookup(self):
+        """Whether submitted values should be looked up by primary key rather
+        than by loading the object list."""
+        return (
+            self.pk_lookup
+            or not self.keep_objects
+            or self.yield_per is not None
+            or self._choices is not None
+            or self._uses_cache()
+        )
+
+    def _uses_cache(self):
+        return self.choice_cache is not None and self.cache_key is not None
+
+    def _lookup_objects(self, pks, query=None):
+        """Load the objects matching `pks` with a primary key query.
+
+        Returns `None` if the query cannot be filtered by primary key.
+        """
+        if query is None:
+            query = self._get_query()
+        entity = _query_entity(query)
+        if entity is None:
+            return None
+        if _is_projection(query):
+            query = query.with_entities(entity)
+        query = self._with_loader_options(query)
+
+        if not _is_limited(query):
+            criterion = _pk_criterion(entity, pks)
+            if criterion is None:
+                return []
+            query = query.filter(criterion)
+
+        if instrumentation._listeners:
+            start = time.perf_counter()
+        # The results of a query with a LIMIT or OFFSET, which cannot be
+        # filtered, are bounded and scanned instead.
+        pks = set(pks)
+        get_pk = self.get_pk
+        objects = {}
+        for obj in query:
+            pk = str(get_pk(obj))
+            if pk in pks:
+                objects.setdefault(pk, obj)
+        if instrumentation._listeners:
+            seconds = time.perf_counter() - start
+            instrumentation._notify(
+                "objects_looked_up", self, seconds, len(pks), len(objects)
+            )
+        return list(objects.items())
+
+    def _get_choices(self):
+        """Return the ``(pk, label, group, render_kw)`` tuples of the options,
+        from the choice cache if one is configured."""
+        if self._choices is None:
+            cache = self.choice_cache
+            if self._uses_cache():
+                choices = cache.get(self.cache_key)
+                # The query is only built once, `query_factory` may run it.
+                query = None
+                version = None
+                if self.cache_version is not None:
+                    query = self._get_query()
+                    version = self._get_version(query)
+                    if getattr(choices, "version", None) != version:
+                        choices = None
+                if instrumentation._listeners:
+                    hit = choices is not None
+                    instrumentation._notify("choice_cache_used", self, hit)
+                if choices is None:
+                    if query is None and self._object_list is None:
+                        query = self._get_query()
+                    choices = self._build_choices(query)
+                    choices.version = version
+                    cache.set(self.cache_key, choices, ttl=self.cache_ttl)
+                    model = self._get_model(query)
+                    if model is not None:
+                        cache.track(self.cache_key, (model,))
+            else:
+                choices = self._build_choices()
+            self._choices = choices
+        return self._choices
+
+    def _get_version(self, query=None):
+        """Run the `cache_version` probe and return its token."""
+        if query is None:
+            query = self._get_query()
+        if callable(self.cache_version):
+            return self.cache_version(query)
+        if not isinstance(query, Query):
+            raise TypeError(
+                f"{type(self).__name__} requires a sqlalchemy Query to probe the"
+                " cache_version expressions."
+            )
+        expressions = self.cache_version
+        if not isinstance(expressions, list | tuple):
+            expressions = [expressions]
+        # A LIMIT would apply to the single row of the probe, and ORDER BY
+        # cannot be removed while it is set.
+        query = query.limit(None).offset(None).order_by(None)
+        return tuple(query.with_entities(*expressions).one())
+
+    def _build_choices(self, query=None):
+        if self.keep_objects or self._object_list is not None:
+            return _ChoiceList(self._make_choices(self._get_object_list(query)))
+        if query is None:
+            query = self._get_query()
+        return self._load_choices(query)
+
+    def _make_choices(self, objects):
+        """Yield the choice tuples of the ``(pk, obj)`` pairs `objects`."""
+        get_label = self.get_label
+        get_group = self.get_group if self._has_groups else lambda _: None
+        get_render_kw = self.get_render_kw
+        for pk, obj in objects:
+            yield (pk, _label_text(get_label(obj)), get_group(obj), get_render_kw(obj))
+
+    def _iter_all_choices(self):
+        """Iterate over the choice tuples of all options, streaming them from
+        the query in `yield_per` mode."""
+        if self._iter_all_choices_streams():
+            return self._make_choices(self._stream_objects())
+        return iter(self._get_choices())
+
+    def _iter_all_choices_streams(self):
+        return not (
+            self.yield_per is None
+            or self._choices is not None
+            or self._object_list is not None
+            or self._uses_cache()
+        )
+
+    def _stream_objects(self, query=None):
+        if query is None:
+            query = self._get_query()
+        if isinstance(query, Query):
+            query = query.yield_per(self.yield_per)
+        return self._iter_objects(query)
+
+    def _get_selected_pks(self):
+        data = self.data
+        return set() if data is None else {str(self.get_pk(data))}
+
+    def __call__(self, **kwargs):
+        if not instrumentation._listeners:
+            return super().__call__(**kwargs)
+        start = time.perf_counter()
+        html = super().__call__(**kwargs)
+        seconds = time.perf_counter() - start
+        instrumentation._notify("field_rendered", self, seconds)
+        return html
+
     def iter_choices(self):
         if self.allow_blank:
             yield (self.blank_value, self.blank_text, self.data is None, {})
 
-        for pk, obj in self._get_object_list():
-            yield (pk, self.get_label(obj), obj == self.data, self.get_render_kw(obj))
+        yield from self._choices_generator(self._iter_all_choices())
 
     def has_groups(self):
         return self._has_groups
 
     def iter_groups(self):
         if self.has_groups():
-            groups = defaultdict(list)
-            for pk, obj in self._get_object_list():
-                groups[self.get_group(obj)].append((pk, obj))
-            for group, choices in groups.items():
+            for group, choices in self._get_groups():
                 yield (group, self._choices_generator(choices))
 
-    def _choices_generator(self, choices):
-        if not choices:
-            _choices = []
-        else:
-            _choices = choices
+    def _get_groups(self):
+        """Return the choice tuples of the options bucketed by group, which
+        are computed once per list of choices unless they are streamed."""
+        if self._iter_all_choices_streams():
+            query = self._get_query()
+            choices = self._make_choices(self._stream_objects(query))
+            if self.order_groups and not _is_limited(query):
+                # The options of each group are contiguous.
+                return itertools.groupby(choices, operator.itemgetter(2))
+            return _group_choices(choices)
+        choices = self._get_choices()
+        if self._group_buckets is None or self._group_buckets[0] is not choices:
+            self._group_buckets = (choices, _group_choices(choices))
+        return self._group_buckets[1]
 
-        for pk, obj in _choices:
-            yield (pk, self.get_label(obj), obj == self.data, self.get_render_kw(obj))
+    def _choices_generator(self, choices):
+        selected = self._get_selected_pks()
+        for pk, label, _, render_kw in choices:
+            yield (pk, label, pk in selected, render_kw)
 
     def process_formdata(self, valuelist):
         if valuelist:
@@ -185,12 +613,11 @@ class QuerySelectField(SelectFieldBase):
     def pre_validate(self, form):
         data = self.data
         if data is not None:
-            for _, obj in self._get_object_list():
-                if data == obj:
-                    break
-            else:
+            if self._data_from_choices:
+                return
+            if not self._find_objects([str(self.get_pk(data))]):
                 raise ValidationError(self.gettext("Not a valid choice"))
-        elif self._formdata or not self.allow_blank:
+        elif self._invalid_formdata or not self.allow_blank:
             raise ValidationError(self.gettext("Not a valid choice"))
 
 
@@ -200,7 +627,8 @@ class QuerySelectMultipleField(QuerySelectField):
     model instances and will be an empty list when no value is selected.
 
     If any of the items in the data list or submitted form data cannot
-    be found in the query, this will result in a validation error.
+    be found in the query, this will result in a validation error. Items are
+    matched to the query results by primary key, as returned by `get_pk`.
     """
 
     widget = widgets.Select(multiple=True)
@@ -216,44 +644,159 @@ class QuerySelectMultipleField(QuerySelectField):
                 "allow_blank=True does not do anything for QuerySelectMultipleField.",
                 stacklevel=2,
             )
-        self._invalid_formdata = False
 
     def _get_data(self):
         formdata = self._formdata
         if formdata is not None:
-            data = []
-            for pk, obj in self._get_object_list():
-                if not formdata:
-                    break
-                elif pk in formdata:
-                    formdata.remove(pk)
-                    data.append(obj)
-            if formdata:
+            objects = self._find_objects(formdata)
+            if len(objects) != len(formdata):
                 self._invalid_formdata = True
-            self._set_data(data)
+            self._set_data([obj for _, obj in objects])
+            self._data_from_choices = True
         return self._data
 
     def _set_data(self, data):
         self._data = data
         self._formdata = None
+        self._data_from_choices = False
 
     data = property(_get_data, _set_data)
 
     def iter_choices(self):
-        for pk, obj in self._get_object_list():
-            yield (pk, self.get_label(obj), obj in self.data, self.get_render_kw(obj))
+        return self._choices_generator(self._iter_all_choices())
+
+    def _get_selected_pks(self):
+        get_pk = self.get_pk
+        return {str(get_pk(obj)) for obj in self.data}
 
     def process_formdata(self, valuelist):
         self._formdata = set(valuelist)
 
     def pre_validate(self, form):
+        # Resolving the submitted values tells whether they are all valid.
+        data = self.data
         if self._invalid_formdata:
             raise ValidationError(self.gettext("Not a valid choice"))
-        elif self.data:
-            obj_list = list(x[1] for x in self._get_object_list())
-            for v in self.data:
-                if v not in obj_list:
-                    raise ValidationError(self.gettext("Not a valid choice"))
+        elif data and not self._data_from_choices:
+            pks = self._get_selected_pks()
+            if len(self._find_objects(pks)) != len(pks):
+                raise ValidationError(self.gettext("Not a valid choice"))
+
+
+class QuerySearchSelectField(QuerySelectField):
+    """A QuerySelectField for relations too large to be rendered as a whole,
+    meant to be paired with a search-as-you-type widget.
+
+    The field only renders the current value and the first `page_size`
+    results of the query. Other options are fetched with :meth:`get_page`,
+    typically from a view returning them as JSON. Submitted values are always
+    resolved and validated with a primary key query, so the query must be a
+    sqlalchemy `Query`, which should be ordered for the pages to be stable.
+
+    Specify `search_by` to choose what is searched: an attribute name or
+    column expression, or a list of them. By default, the `get_label`
+    attribute is searched if it is a column of the model.
+
+    :meth:`get_page` returns at most `max_page_size` options, whatever limit
+    it is asked for.
+    """
+
+    def __init__(
+        self,
+        label=None,
+        validators=None,
+        search_by=None,
+        page_size=20,
+        max_page_size=100,
+        **kwargs,
+    ):
+        super().__init__(label, validators, **kwargs)
+        if search_by is not None and (
+            isinstance(search_by, str) or not isinstance(search_by, list | tuple)
+        ):
+            search_by = [search_by]
+        self.search_by = search_by
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+
+    def _prefers_lookup(self):
+        return True
+
+    def has_groups(self):
+        return False
+
+    def iter_choices(self):
+        data = self.data
+        if self.allow_blank:
+            yield (self.blank_value, self.blank_text, data is None, {})
+
+        selected = None
+        if data is not None:
+            selected = str(self.get_pk(data))
+            yield (
+                selected,
+                _label_text(self.get_label(data)),
+                True,
+                self.get_render_kw(data),
+            )
+
+        for pk, obj in self._iter_page(None, 0, self.page_size):
+            if pk != selected:
+                yield (
+                    pk,
+                    _label_text(self.get_label(obj)),
+                    False,
+                    self.get_render_kw(obj),
+                )
+
+    def get_page(self, term=None, offset=0, limit=None):
+        """Return the options matching the search `term`, starting at
+        `offset`, as a JSON-serializable dictionary::
+
+            {"options": [(pk, label), ...], "more": True}
+
+        At most `limit` options are returned, `page_size` by default and
+        `max_page_size` at most, and ``more`` tells whether there are other
+        results after them.
+        """
+        if limit is None:
+            limit = self.page_size
+        # Both usually come from request parameters.
+        limit = max(min(limit, self.max_page_size), 0)
+        offset = max(offset, 0)
+        options = [
+            (pk, str(self.get_label(obj)))
+            for pk, obj in self._iter_page(term, offset, limit + 1)
+        ]
+        return {"options": options[:limit], "more": len(options) > limit}
+
+    def _iter_page(self, term, offset, limit):
+        query = self._get_query()
+        entity = _query_entity(query)
+        if entity is None:
+            raise TypeError(f"{type(self).__name__} requires a sqlalchemy Query.")
+
+        if term:
+            columns = self._search_columns(entity)
+            if not columns:
+                raise TypeError(f"Cannot search {self.name}, no search_by given.")
+            term = term.lower()
+            query = query.filter(
+                or_(*(func.lower(c).contains(term, autoescape=True) for c in columns))
+            )
+
+        query = self._with_loader_options(query)
+        get_pk = self.get_pk
+        for obj in query.offset(offset).limit(limit):
+            yield str(get_pk(obj)), obj
+
+    def _search_columns(self, entity):
+        if self.search_by is None:
+            spec = self._label_spec
+            if isinstance(spec, str) and spec in sainspect(entity).mapper.column_attrs:
+                return [getattr(entity, spec)]
+            return []
+        return [getattr(entity, c) if isinstance(c, str) else c for c in self.search_by]
 
 
 class QueryRadioField(QuerySelectField):
@@ -266,6 +809,512 @@ class QueryCheckboxField(QuerySelectMultipleField):
     option_widget = widgets.CheckboxInput()
 
 
+class _AsyncQueryMixin:
+    """Loads the choices of a query-backed field from an asyncio session.
+
+    The query is a ``select()`` statement, given by `query_factory` or set as
+    `query`, which is run by :meth:`load_choices` with ``await
+    session.execute(...)``. `session` is either an `AsyncSession`, which is
+    used as is, or an `async_sessionmaker`, from which a session is opened
+    for each load. The objects are loaded before the field is rendered or
+    validated, so the labels, groups and HTML attributes of the options
+    should only use attributes loaded by the statement.
+    """
+
+    def __init__(self, *args, session=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.session = session
+
+    async def load_choices(self):
+        """Run the query of the field and keep its results, unless they are
+        already loaded."""
+        if self._object_list is None:
+            if instrumentation._listeners:
+                start = time.perf_counter()
+            statement = self._get_query()
+            objects = await self._execute(statement)
+            get_pk = self.get_pk
+            self._object_list = [(str(get_pk(obj)), obj) for obj in objects]
+            if instrumentation._listeners:
+                seconds = time.perf_counter() - start
+                rows = len(self._object_list)
+                instrumentation._notify("choices_loaded", self, seconds, rows)
+        return self._object_list
+
+    async def _execute(self, statement):
+        session = self.session
+        if session is None:
+            raise TypeError(f"{type(self).__name__} requires a session.")
+        if hasattr(session, "execute"):
+            return _fetch_objects(statement, await session.execute(statement))
+        # A session factory, the objects have to be fetched before the
+        # session it opens is closed.
+        async with session() as session:
+            return _fetch_objects(statement, await session.execute(statement))
+
+    async def validate_async(self, form, extra_validators=()):
+        """Load the choices of the field, then validate it."""
+        await self.load_choices()
+        return self.validate(form, extra_validators)
+
+    def _get_object_list(self, query=None):
+        if self._object_list is None:
+            raise RuntimeError(
+                f"The choices of {self.name} are not loaded, "
+                "await load_choices() first."
+            )
+        return self._object_list
+
+    def _prefers_lookup(self):
+        return False
+
+    def _lookup_objects(self, pks, query=None):
+        # Primary key queries would have to run synchronously.
+        return None
+
+    def _iter_all_choices_streams(self):
+        return False
+
+
+class AsyncQuerySelectField(_AsyncQueryMixin, QuerySelectField):
+    """A :class:`QuerySelectField` whose choices are loaded with an asyncio
+    `session`::
+
+        field = AsyncQuerySelectField(
+            session=async_session, query_factory=lambda: select(User)
+        )
+
+    :meth:`load_choices` must be awaited before the field is rendered or
+    validated, which :meth:`validate_async` and :func:`load_form_choices` do.
+    ``pk_lookup`` and ``yield_per`` are not supported, and a choice cache
+    only spares building the options, the objects are still loaded.
+    """
+
+
+class AsyncQuerySelectMultipleField(_AsyncQueryMixin, QuerySelectMultipleField):
+    """A :class:`QuerySelectMultipleField` whose choices are loaded with an
+    asyncio `session`, see :class:`AsyncQuerySelectField`."""
+
+
+async def load_form_choices(form):
+    """Load the choices of the async fields of `form`, so it can be rendered
+    and validated::
+
+        form = UserForm(formdata)
+        await load_form_choices(form)
+        if form.validate():
+            ...
+
+    The queries run concurrently, except for fields sharing an
+    `AsyncSession`, which cannot run several statements at once and are
+    loaded one after the other. Fields given an `async_sessionmaker` each
+    open their own session.
+    """
+    groups = {}
+    for field in form:
+        if isinstance(field, _AsyncQueryMixin):
+            session = field.session
+            key = id(session) if hasattr(session, "execute") else id(field)
+            groups.setdefault(key, []).append(field)
+    await asyncio.gather(*(_load_choices(fields) for fields in groups.values()))
+
+
+async def _load_choices(fields):
+    for field in fields:
+        await field.load_choices()
+
+
+def prefetch_choices(form, session_factory, max_workers=None):
+    """Load the choices of the query-backed fields of `form` concurrently,
+    in a thread pool, instead of one after the other while it is rendered.
+
+    The queries of the fields are built in the calling thread. Those which
+    are sqlalchemy queries then each run in a thread of the pool, in a new
+    session from `session_factory`, such as a `sessionmaker`, so with their
+    own connection. The sessions are closed once the options are loaded,
+    and submitted values are then resolved with a primary key query, as with
+    `pk_lookup`, so `data` is loaded in the session of the field's query.
+    Other queries, such as lists of results, are loaded in the calling
+    thread.
+
+    Fields whose choices are not loaded as a whole, because they are cached,
+    streamed with `yield_per` or searched, are left alone, as are the async
+    fields, see :func:`load_form_choices`.
+    """
+    fields = [
+        field
+        for field in form
+        if isinstance(field, QuerySelectField)
+        and not isinstance(field, _AsyncQueryMixin | QuerySearchSelectField)
+        and field._object_list is None
+        and field._choices is None
+        and field.yield_per is None
+        and not field._uses_cache()
+    ]
+    if not fields:
+        return
+
+    queries = [(field, field._get_query()) for field in fields]
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for field, query in queries:
+            if isinstance(query, Query):
+                future = executor.submit(_load_prefetch, field, query, session_factory)
+                futures.append((field, query, future))
+            else:
+                _set_prefetched(field, query, _load_prefetch(field, query))
+
+    for field, query, future in futures:
+        _set_prefetched(field, query, future.result())
+
+
+def batch_load_choices(form):
+    """Load the options of several query-backed fields of `form` with a
+    single ``UNION ALL`` query per session, instead of one query per field.
+
+    This is meant for fields on small lookup tables, when round trips to the
+    database dominate. A field is batched if its query is a sqlalchemy
+    `Query` on a model with a single integer or string primary key, its
+    `get_label` and `get_group` are names of string columns, it has no
+    `get_pk` nor `get_render_kw` and its options are not cached. Other fields
+    are left alone and load their options as usual.
+
+    Only the primary keys, labels and groups of the options are loaded, the
+    primary keys being converted to strings by the database. Submitted
+    values are then resolved with
+    a primary key query, as with `pk_lookup`. The ``ORDER BY`` of each query
+    is kept in a subquery, which the usual databases follow but which SQL
+    does not guarantee.
+    """
+    batches = {}
+    for field in form:
+        query = _batch_query(field)
+        if query is not None:
+            batches.setdefault(query.session, []).append((field, query))
+
+    for session, batch in batches.items():
+        if instrumentation._listeners:
+            start = time.perf_counter()
+        # The members are tagged with the position of their field.
+        queries = [
+            query.add_columns(literal(tag).label("tag"))
+            for tag, (_, query) in enumerate(batch)
+        ]
+        if len(queries) == 1:
+            statement = queries[0].statement
+        else:
+            statement = union_all(*(select(q.subquery()) for q in queries))
+        choices = defaultdict(list)
+        for pk, label, group, tag in session.execute(statement):
+            choices[tag].append((pk, _label_text(label), group, {}))
+        for tag, (field, _) in enumerate(batch):
+            field._choices = _ChoiceList(choices[tag])
+        if instrumentation._listeners:
+            seconds = time.perf_counter() - start
+            for tag, (field, _) in enumerate(batch):
+                rows = len(choices[tag])
+                instrumentation._notify("choices_loaded", field, seconds, rows)
+
+
+def _batch_query(field):
+    """Return a query selecting the ``(pk, label, group)`` rows of the
+    options of `field`, or `None` if they cannot be computed in SQL."""
+    if (
+        not isinstance(field, QuerySelectField)
+        or isinstance(field, _AsyncQueryMixin | QuerySearchSelectField)
+        or field._choices is not None
+        or field._object_list is not None
+        or field._uses_cache()
+        or field.get_pk is not get_pk_from_identity
+        or field._render_kw_spec is not None
+    ):
+        return None
+
+    query = field._get_query()
+    entity = _query_entity(query)
+    if entity is None or query.session is None:
+        return None
+    mapper = sainspect(entity).mapper
+    if len(mapper.primary_key) != 1:
+        return None
+    pk_attr = getattr(entity, mapper.get_property_by_column(mapper.primary_key[0]).key)
+    if _python_type(pk_attr) not in (int, str):
+        return None
+
+    # Other types would be converted to strings differently than by str().
+    columns = []
+    for spec in (field._label_spec, field._group_spec):
+        if spec is None and columns:
+            columns.append(cast(null(), String))
+        elif (
+            isinstance(spec, str)
+            and spec in mapper.column_attrs
+            and _python_type(getattr(entity, spec)) is str
+        ):
+            columns.append(getattr(entity, spec))
+        else:
+            return None
+
+    return query.with_entities(
+        cast(pk_attr, String).label("pk"),
+        columns[0].label("label"),
+        columns[1].label("group"),
+    )
+
+
+def _python_type(attr):
+    """Return the Python type of the values of a column attribute, or `None`
+    if its type does not tell."""
+    try:
+        return attr.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def _load_prefetch(field, query, session_factory=None):
+    """Load the object list of `field` from `query`, or its choices if it
+    does not keep the objects, in a new session for sqlalchemy queries."""
+    load = field._load_object_list if field.keep_objects else field._load_choices
+    if session_factory is None:
+        return load(query)
+    with session_factory() as session:
+        return load(query.with_session(session))
+
+
+def _set_prefetched(field, query, result):
+    if field.keep_objects:
+        field._object_list = result
+        field._projected = _is_projection(query)
+        field._detached = isinstance(query, Query)
+    else:
+        field._choices = result
+
+
+_pk_types = {
+    int: int,
+    float: float,
+    str: str,
+    Decimal: Decimal,
+    uuid.UUID: uuid.UUID,
+}
+
+
+def _label_text(label):
+    """Convert an option label to a string that can be stored in a cache."""
+    if isinstance(label, str):
+        return label
+    if hasattr(label, "__html__"):
+        return Markup(label.__html__())
+    return str(label)
+
+
+def _query_entity(query):
+    """Return the mapped entity a `Query` selects, either as a whole or as
+    some of its columns, or `None` if the query selects anything else."""
+    if not isinstance(query, Query):
+        return None
+    descriptions = query.column_descriptions
+    if not descriptions:
+        return None
+    entity = descriptions[0]["entity"]
+    if entity is None or any(d["entity"] is not entity for d in descriptions):
+        return None
+    if len(descriptions) > 1 and any(d["expr"] is entity for d in descriptions):
+        return None
+    return entity
+
+
+def _loader_options(entity, specs):
+    """Build the loader options loading the attributes which the dotted
+    attribute names among `specs` go through: relationships are eagerly
+    loaded, with a join for those referring to a single object, and deferred
+    columns are undeferred."""
+    options = []
+    for spec in specs:
+        if not isinstance(spec, str):
+            continue
+        option = None
+        mapper = sainspect(entity).mapper
+        cls = entity
+        for name in spec.split("."):
+            prop = mapper.attrs.get(name)
+            if isinstance(prop, RelationshipProperty):
+                attr = getattr(cls, name)
+                if option is None:
+                    option = (selectinload if prop.uselist else joinedload)(attr)
+                elif prop.uselist:
+                    option = option.selectinload(attr)
+                else:
+                    option = option.joinedload(attr)
+                mapper = prop.mapper
+                cls = mapper.class_
+                continue
+            if isinstance(prop, ColumnProperty) and prop.deferred:
+                attr = getattr(cls, name)
+                option = undefer(attr) if option is None else option.undefer(attr)
+            break
+        if option is not None:
+            options.append(option)
+    return options
+
+
+class _ChoiceList:
+    """Compact sequence of ``(pk, label, group, render_kw)`` choice tuples,
+    stored as parallel lists. The group and HTML attribute lists are left out
+    when no option has any."""
+
+    __slots__ = ("pks", "labels", "groups", "render_kws", "version", "markup")
+
+    def __init__(self, choices=()):
+        pks, labels, groups, render_kws = [], [], [], []
+        for pk, label, group, render_kw in choices:
+            pks.append(pk)
+            labels.append(label)
+            groups.append(group)
+            render_kws.append(render_kw)
+        self.pks = pks
+        self.labels = labels
+        self.groups = groups if any(g is not None for g in groups) else None
+        self.render_kws = render_kws if any(render_kws) else None
+        # The token of the rows the choices were built from, if any.
+        self.version = None
+        # Rendered options, see `wtforms_sqlalchemy.widgets.CachedSelect`.
+        self.markup = None
+
+    def __len__(self):
+        return len(self.pks)
+
+    def __getitem__(self, index):
+        return (
+            self.pks[index],
+            self.labels[index],
+            None if self.groups is None else self.groups[index],
+            {} if self.render_kws is None else self.render_kws[index],
+        )
+
+    def __iter__(self):
+        groups = self.groups
+        if groups is None:
+            groups = itertools.repeat(None)
+        render_kws = self.render_kws
+        if render_kws is None:
+            render_kws = iter(dict, None)
+        return zip(self.pks, self.labels, groups, render_kws, strict=False)
+
+    def __eq__(self, other):
+        if not isinstance(other, _ChoiceList | list | tuple):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __getstate__(self):
+        return (self.pks, self.labels, self.groups, self.render_kws, self.version)
+
+    def __setstate__(self, state):
+        self.pks, self.labels, self.groups, self.render_kws, self.version = state
+        self.markup = None
+
+
+def _group_choices(choices):
+    """Bucket choice tuples by group, in the order groups first appear."""
+    groups = defaultdict(list)
+    for choice in choices:
+        groups[choice[2]].append(choice)
+    return list(groups.items())
+
+
+def _fetch_objects(statement, result):
+    """Return the results of a ``select()`` statement, unpacking the rows to
+    objects if it selects a single mapped entity."""
+    descriptions = getattr(statement, "column_descriptions", ())
+    if len(descriptions) == 1 and descriptions[0]["expr"] is descriptions[0]["entity"]:
+        return result.scalars().all()
+    return result.all()
+
+
+def _is_limited(query):
+    """Whether `query` is a `Query` with a LIMIT or OFFSET, which cannot be
+    filtered or ordered any further."""
+    return isinstance(query, Query) and (
+        query._limit_clause is not None or query._offset_clause is not None
+    )
+
+
+def _is_projection(query):
+    """Whether `query` selects columns of an entity rather than the entity."""
+    entity = _query_entity(query)
+    return entity is not None and query.column_descriptions[0]["expr"] is not entity
+
+
+def _pk_attribute_getter(mapper):
+    """Return a `get_pk` function reading the primary key attributes of
+    `mapper` by name, which works for both instances and rows selecting
+    these attributes."""
+    getter = operator.attrgetter(
+        *(mapper.get_property_by_column(column).key for column in mapper.primary_key)
+    )
+    if len(mapper.primary_key) == 1:
+        return getter
+    return lambda obj: ":".join(str(x) for x in getter(obj))
+
+
+def _pk_criterion(entity, pks):
+    """Build a SQL criterion matching the primary key strings `pks`, as
+    produced by `get_pk_from_identity`, on `entity`.
+
+    Keys that cannot be converted to the column types are skipped, and `None`
+    is returned if none are left.
+    """
+    mapper = sainspect(entity).mapper
+    attrs = [
+        getattr(entity, mapper.get_property_by_column(column).key)
+        for column in mapper.primary_key
+    ]
+
+    keys = []
+    for pk in pks:
+        values = [pk] if len(attrs) == 1 else pk.split(":")
+        if len(values) != len(attrs):
+            continue
+        try:
+            keys.append([_coerce_pk(a, v) for a, v in zip(attrs, values, strict=True)])
+        except (TypeError, ValueError, ArithmeticError):
+            continue
+
+    if not keys:
+        return None
+    if len(attrs) == 1:
+        return attrs[0].in_([key[0] for key in keys])
+    return or_(
+        *(and_(*(a == v for a, v in zip(attrs, key, strict=True))) for key in keys)
+    )
+
+
+def _coerce_pk(attr, value):
+    try:
+        python_type = attr.type.python_type
+    except NotImplementedError:
+        return value
+    return _pk_types.get(python_type, str)(value)
+
+
+_pk_getter_key = "wtforms_sqlalchemy.pk_getter"
+
+
 def get_pk_from_identity(obj):
-    key = identity_key(instance=obj)[1]
-    return ":".join(str(x) for x in key)
+    # The primary key attributes are read directly, with a getter compiled
+    # once per class, which is much faster than going through
+    # sqlalchemy.orm.util.identity_key. It is kept by the class manager, so
+    # it goes away with the mapping of the class.
+    manager = obj._sa_instance_state.manager
+    try:
+        getter = manager.info[_pk_getter_key]
+    except KeyError:
+        getter = manager.info[_pk_getter_key] = _compile_pk_getter(manager.mapper)
+    return getter(obj)
+
+
+def _compile_pk_getter(mapper):
+    getter = _pk_attribute_getter(mapper)
+    if len(mapper.primary_key) == 1:
+        return lambda obj: str(getter(obj))
+    return getter
@@ -0,0 +1,144 @@
+"""Listeners reporting what query-backed fields and form generation cost.
+
+Fields and :func:`~wtforms_sqlalchemy.orm.model_form` only measure anything
+while a listener is registered, so instrumentation costs nothing otherwise.
+
+::
+
+    stats = FieldStats()
+    add_listener(stats)
+"""
+
+import threading
+
+__all__ = (
+    "Listener",
+    "FieldStats",
+    "add_listener",
+    "remove_listener",
+)
+
+# Replaced rather than modified, so it can be iterated without a lock, and
+# checked for emptiness on every call instead of looking listeners up.
+_listeners = ()
+_lock = threading.Lock()
+
+
+class Listener:
+    """Base class for instrumentation listeners.
+
+    Subclasses override the methods of the events they are interested in.
+    Events can be sent from several threads at once, for instance by
+    :func:`~wtforms_sqlalchemy.fields.prefetch_choices`, and exceptions
+    raised by listeners propagate to the code sending them.
+    """
+
+    def choices_loaded(self, field, seconds, rows):
+        """The query of `field` ran and `rows` objects were loaded from it,
+        in `seconds`, including computing their primary keys. For fields
+        loaded by :func:`~wtforms_sqlalchemy.fields.batch_load_choices`,
+        `seconds` is the time of the whole batch query."""
+
+    def field_rendered(self, field, seconds):
+        """`field` was rendered in `seconds`, including loading its choices
+        if they were not loaded yet."""
+
+    def choice_cache_used(self, field, hit):
+        """The choice cache of `field` was consulted, `hit` telling whether
+        it held its options."""
+
+    def objects_looked_up(self, field, seconds, keys, rows):
+        """Submitted values of `field` were resolved with a primary key query
+        for `keys` values, which found `rows` objects in `seconds`."""
+
+    def form_generated(self, model, form_class, seconds):
+        """:func:`~wtforms_sqlalchemy.orm.model_form` returned `form_class`
+        for `model` in `seconds`."""
+
+
+class FieldStats(Listener):
+    """A listener accumulating the events of each field, by field name, and
+    of each generated form, by model::
+
+        >>> stats.fields["country"]
+        {"loads": 1, "load_seconds": 0.002, "rows": 250, ...}
+
+    It is thread-safe. :meth:`reset` clears the accumulated statistics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.fields = {}
+        self.forms = {}
+
+    def _field(self, field):
+        stats = self.fields.get(field.name)
+        if stats is None:
+            stats = self.fields[field.name] = {
+                "loads": 0,
+                "load_seconds": 0.0,
+                "rows": 0,
+                "renders": 0,
+                "render_seconds": 0.0,
+                "cache_hits": 0,
+                "cache_misses": 0,
+                "lookups": 0,
+                "lookup_seconds": 0.0,
+                "lookup_rows": 0,
+            }
+        return stats
+
+    def choices_loaded(self, field, seconds, rows):
+        with self._lock:
+            stats = self._field(field)
+            stats["loads"] += 1
+            stats["load_seconds"] += seconds
+            stats["rows"] += rows
+
+    def field_rendered(self, field, seconds):
+        with self._lock:
+            stats = self._field(field)
+            stats["renders"] += 1
+            stats["render_seconds"] += seconds
+
+    def choice_cache_used(self, field, hit):
+        with self._lock:
+            self._field(field)["cache_hits" if hit else "cache_misses"] += 1
+
+    def objects_looked_up(self, field, seconds, keys, rows):
+        with self._lock:
+            stats = self._field(field)
+            stats["lookups"] += 1
+            stats["lookup_seconds"] += seconds
+            stats["lookup_rows"] += rows
+
+    def form_generated(self, model, form_class, seconds):
+        with self._lock:
+            stats = self.forms.setdefault(model, {"count": 0, "seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] += seconds
+
+    def reset(self):
+        with self._lock:
+            self.fields.clear()
+            self.forms.clear()
+
+
+def add_listener(listener):
+    """Register a :class:`Listener` to receive the events of every field and
+    form generation."""
+    global _listeners
+    with _lock:
+        _listeners = (*_listeners, listener)
+
+
+def remove_listener(listener):
+    """Unregister a listener added with :func:`add_listener`."""
+    global _listeners
+    with _lock:
+        _listeners = tuple(item for item in _listeners if item is not listener)
+
+
+def _notify(event, *args):
+    for listener in _listeners:
+        getattr(listener, event)(*args)
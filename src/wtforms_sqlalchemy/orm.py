@@ -1,18 +1,52 @@
 """Tools for generating forms based on SQLAlchemy models."""
 
+import functools
 import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from sqlalchemy import inspect as sainspect
+from sqlalchemy import select
+from sqlalchemy.orm import ColumnProperty
+from sqlalchemy.orm import scoped_session
 from wtforms import fields as wtforms_fields
 from wtforms import validators
 from wtforms.form import Form
 
+from . import instrumentation
+from .fields import _pk_attribute_getter
+from .fields import AsyncQuerySelectField
+from .fields import AsyncQuerySelectMultipleField
 from .fields import QuerySelectField
 from .fields import QuerySelectMultipleField
 
+try:
+    from sqlalchemy.ext.asyncio import async_scoped_session
+    from sqlalchemy.ext.asyncio import AsyncSession
+except ImportError:  # pragma: no cover
+    _async_session_types = ()
+    _async_registry_types = ()
+else:
+    _async_registry_types = (async_scoped_session,)
+    try:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+    except ImportError:  # pragma: no cover, SQLAlchemy < 2.0
+        pass
+    else:
+        _async_registry_types += (async_sessionmaker,)
+    _async_session_types = (AsyncSession, *_async_registry_types)
+
+# Sessions which outlive requests, so the form classes of model_form can be
+# cached for them without keeping a request's session alive.
+_long_lived_session_types = (scoped_session, *_async_registry_types)
+
 __all__ = (
     "model_fields",
     "model_form",
+    "model_forms",
+    "lazy_model_form",
+    "clear_model_form_cache",
 )
 
 
@@ -36,17 +70,41 @@ class ModelConverterBase:
         if not converters:
             converters = {}
 
-        for name in dir(self):
-            obj = getattr(self, name)
-            if hasattr(obj, "_converter_for"):
-                for classname in obj._converter_for:
-                    converters[classname] = obj
+        for classname, name in self._get_converter_names().items():
+            converters[classname] = getattr(self, name)
 
         self.converters = converters
+        self._type_converters = {}
+
+    @classmethod
+    def _get_converter_names(cls):
+        """Map the type names handled by the `converts` decorated methods of
+        the class to the names of these methods. This is computed once per
+        class."""
+        names = cls.__dict__.get("_converter_names")
+        if names is None:
+            names = {}
+            for name in dir(cls):
+                obj = getattr(cls, name)
+                if hasattr(obj, "_converter_for"):
+                    for classname in obj._converter_for:
+                        names[classname] = name
+            cls._converter_names = names
+        return names
 
     def get_converter(self, column):
         """Searches `self.converters` for a converter method with an argument
-        that matches the column's type."""
+        that matches the column's type.
+
+        The result is remembered for each column type class."""
+        type_class = type(column.type)
+        converter = self._type_converters.get(type_class)
+        if converter is None:
+            converter = self._find_converter(column)
+            self._type_converters[type_class] = converter
+        return converter
+
+    def _find_converter(self, column):
         if self.use_mro:
             types = inspect.getmro(type(column.type))
         else:
@@ -72,7 +130,9 @@ class ModelConverterBase:
             f"Could not find field converter for column {column.name} ({types[0]!r})."
         )
 
-    def convert(self, model, mapper, prop, field_args, db_session=None):
+    def convert(
+        self, model, mapper, prop, field_args, db_session=None, projected=False
+    ):
         if not hasattr(prop, "columns") and not hasattr(prop, "direction"):
             return
         elif not hasattr(prop, "direction") and len(prop.columns) != 1:
@@ -96,6 +156,7 @@ class ModelConverterBase:
 
         converter = None
         column = None
+        extra = {}
 
         if not hasattr(prop, "direction"):
             column = prop.columns[0]
@@ -143,14 +204,36 @@ class ModelConverterBase:
             kwargs.update(
                 {
                     "allow_blank": nullable,
-                    "query_factory": lambda: db_session.query(foreign_model).all(),
+                    "query_factory": lambda: db_session.query(foreign_model),
                 }
             )
 
-            converter = self.converters[prop.direction.name]
+            if isinstance(db_session, _async_session_types):
+                # The choices are loaded later, with ``await load_choices()``.
+                kwargs["query_factory"] = lambda: select(foreign_model)
+                converter = self.converters.get("ASYNC_" + prop.direction.name)
+                if converter is None:
+                    raise ModelConversionError(
+                        f"Cannot convert field {prop.key} with an async session."
+                    )
+                extra["db_session"] = db_session
+            else:
+                columns = (
+                    _projection_columns(prop.mapper, kwargs) if projected else None
+                )
+                if columns is not None:
+                    kwargs["query_factory"] = lambda: db_session.query(*columns)
+                    kwargs.setdefault("get_pk", _pk_attribute_getter(prop.mapper))
+
+                converter = self.converters[prop.direction.name]
 
         return converter(
-            model=model, mapper=mapper, prop=prop, column=column, field_args=kwargs
+            model=model,
+            mapper=mapper,
+            prop=prop,
+            column=column,
+            field_args=kwargs,
+            **extra,
         )
 
 
@@ -230,14 +313,70 @@ class ModelConverter(ModelConverterBase):
         field_args["validators"].append(validators.UUID())
         return wtforms_fields.StringField(**field_args)
 
+    @classmethod
+    def _relation_common(cls, prop, field_args, **extra):
+        # Tells the choice cache which model the options are loaded from.
+        field_args.setdefault("model", prop.mapper.class_)
+
+    @classmethod
+    def _async_relation_common(cls, db_session, field_args, **extra):
+        cls._relation_common(field_args=field_args, **extra)
+        field_args["session"] = db_session
+
     @converts("MANYTOONE")
     def conv_ManyToOne(self, field_args, **extra):
+        self._relation_common(field_args=field_args, **extra)
         return QuerySelectField(**field_args)
 
     @converts("MANYTOMANY", "ONETOMANY")
     def conv_ManyToMany(self, field_args, **extra):
+        self._relation_common(field_args=field_args, **extra)
         return QuerySelectMultipleField(**field_args)
 
+    @converts("ASYNC_MANYTOONE")
+    def conv_AsyncManyToOne(self, field_args, **extra):
+        self._async_relation_common(field_args=field_args, **extra)
+        return AsyncQuerySelectField(**field_args)
+
+    @converts("ASYNC_MANYTOMANY", "ASYNC_ONETOMANY")
+    def conv_AsyncManyToMany(self, field_args, **extra):
+        self._async_relation_common(field_args=field_args, **extra)
+        return AsyncQuerySelectMultipleField(**field_args)
+
+
+_default_converter = None
+
+
+def _get_default_converter():
+    # Converters do not keep state between conversions, so a single instance
+    # is shared to reuse its converter resolutions.
+    global _default_converter
+    if _default_converter is None:
+        _default_converter = ModelConverter()
+    return _default_converter
+
+
+def _projection_columns(mapper, field_args):
+    """Return the primary key, label, group and render_kw columns of `mapper`
+    to select for a relation field, or `None` if options need whole objects
+    because `get_label`, `get_group` or `get_render_kw` are not column names."""
+    keys = [mapper.get_property_by_column(column).key for column in mapper.primary_key]
+    if field_args.get("get_label") is None:
+        return None
+
+    for name in ("get_label", "get_group", "get_render_kw"):
+        spec = field_args.get(name)
+        if spec is None:
+            continue
+        if not isinstance(spec, str) or not isinstance(
+            mapper.attrs.get(spec), ColumnProperty
+        ):
+            return None
+        if spec not in keys:
+            keys.append(spec)
+
+    return [getattr(mapper.class_, key) for key in keys]
+
 
 def model_fields(
     model,
@@ -248,13 +387,14 @@ def model_fields(
     converter=None,
     exclude_pk=False,
     exclude_fk=False,
+    projected=False,
 ):
     """Generate a dictionary of fields for a given SQLAlchemy model.
 
     See `model_form` docstring for description of parameters.
     """
     mapper = sainspect(model)
-    converter = converter or ModelConverter()
+    converter = converter or _get_default_converter()
     field_args = field_args or {}
     properties = []
 
@@ -275,7 +415,9 @@ def model_fields(
 
     field_dict = {}
     for name, prop in properties:
-        field = converter.convert(model, mapper, prop, field_args.get(name), db_session)
+        field = converter.convert(
+            model, mapper, prop, field_args.get(name), db_session, projected=projected
+        )
         if field is not None:
             field_dict[name] = field
 
@@ -293,6 +435,8 @@ def model_form(
     exclude_pk=True,
     exclude_fk=True,
     type_name=None,
+    projected=False,
+    cache=False,
 ):
     """
     Create a wtforms Form for a given SQLAlchemy model class::
@@ -304,7 +448,12 @@ def model_form(
     :param model:
         A SQLAlchemy mapped model class.
     :param db_session:
-        An optional SQLAlchemy Session.
+        An optional SQLAlchemy Session. If it is an ``AsyncSession``, an
+        ``async_scoped_session`` or an ``async_sessionmaker``, relations are
+        converted to the async fields of :mod:`wtforms_sqlalchemy.fields`,
+        whose choices must be loaded with
+        :func:`~wtforms_sqlalchemy.fields.load_form_choices` before the form
+        is rendered or validated. ``projected`` has no effect in that case.
     :param base_class:
         Base form class to extend from. Must be a ``wtforms.Form`` subclass.
     :param only:
@@ -325,10 +474,107 @@ def model_form(
         An optional boolean to force foreign keys exclusion.
     :param type_name:
         An optional string to set returned type name.
+    :param projected:
+        If true, relation fields only select the primary key columns of the
+        related model, plus the columns named by their ``get_label``,
+        ``get_group`` and ``get_render_kw`` field arguments, and load the
+        selected objects by primary key. Relations whose ``get_label`` is not
+        a column name still load whole objects.
+    :param cache:
+        If true, the generated class is kept in a bounded cache and returned
+        again by later calls with the same arguments, instead of converting
+        the model each time. Only calls without a session, or with a
+        ``scoped_session``, an ``async_scoped_session`` or an
+        ``async_sessionmaker``, are cached: the relation fields of the class
+        refer to the session, which would otherwise be kept alive. Calls with
+        ``field_args`` are not cached either. See
+        :func:`clear_model_form_cache`.
     """
     if not hasattr(model, "_sa_class_manager"):
         raise TypeError("model must be a sqlalchemy mapped model")
 
+    if instrumentation._listeners:
+        start = time.perf_counter()
+
+    if (
+        cache
+        and not field_args
+        and (db_session is None or isinstance(db_session, _long_lived_session_types))
+    ):
+        form_class = _cached_model_form(
+            model,
+            db_session,
+            base_class,
+            tuple(only) if only else None,
+            tuple(exclude) if exclude else None,
+            converter,
+            exclude_pk,
+            exclude_fk,
+            type_name,
+            projected,
+        )
+    else:
+        form_class = _model_form(
+            model,
+            db_session,
+            base_class,
+            only,
+            exclude,
+            field_args,
+            converter,
+            exclude_pk,
+            exclude_fk,
+            type_name,
+            projected,
+        )
+
+    if instrumentation._listeners:
+        seconds = time.perf_counter() - start
+        instrumentation._notify("form_generated", model, form_class, seconds)
+    return form_class
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_model_form(
+    model,
+    db_session,
+    base_class,
+    only,
+    exclude,
+    converter,
+    exclude_pk,
+    exclude_fk,
+    type_name,
+    projected,
+):
+    return _model_form(
+        model,
+        db_session,
+        base_class,
+        only,
+        exclude,
+        None,
+        converter,
+        exclude_pk,
+        exclude_fk,
+        type_name,
+        projected,
+    )
+
+
+def _model_form(
+    model,
+    db_session,
+    base_class,
+    only,
+    exclude,
+    field_args,
+    converter,
+    exclude_pk,
+    exclude_fk,
+    type_name,
+    projected,
+):
     type_name = type_name or str(model.__name__ + "Form")
     field_dict = model_fields(
         model,
@@ -339,5 +585,173 @@ def model_form(
         converter,
         exclude_pk=exclude_pk,
         exclude_fk=exclude_fk,
+        projected=projected,
     )
     return type(type_name, (base_class,), field_dict)
+
+
+class _LazyFormMeta:
+    """Metaclass mixin generating the fields of a form class the first time
+    it is instantiated or one of its attributes is looked up."""
+
+    def __call__(cls, *args, **kwargs):
+        _load_lazy_fields(cls)
+        return super().__call__(*args, **kwargs)
+
+    def __getattr__(cls, name):
+        # Only called for attributes which do not exist (yet).
+        if name.startswith("__"):
+            raise AttributeError(name)
+        _load_lazy_fields(cls)
+        # Look the attribute up again even if another thread set the fields
+        # while this one waited for it.
+        return type.__getattribute__(cls, name)
+
+    def __dir__(cls):
+        _load_lazy_fields(cls)
+        return super().__dir__()
+
+
+@functools.cache
+def _lazy_metaclass(metaclass):
+    return type(f"Lazy{metaclass.__name__}", (_LazyFormMeta, metaclass), {})
+
+
+def _load_lazy_fields(cls):
+    """Set the generated fields of `cls` and its bases which are still
+    pending."""
+    for klass in cls.__mro__:
+        if klass.__dict__.get("_lazy_fields") is None:
+            continue
+        with klass._lazy_lock:
+            factory = klass.__dict__["_lazy_fields"]
+            if factory is None:
+                continue
+            for name, field in factory().items():
+                if name not in klass.__dict__:
+                    setattr(klass, name, field)
+            klass._lazy_fields = None
+
+
+def lazy_model_form(
+    model,
+    db_session=None,
+    base_class=Form,
+    only=None,
+    exclude=None,
+    field_args=None,
+    converter=None,
+    exclude_pk=True,
+    exclude_fk=True,
+    type_name=None,
+    projected=False,
+):
+    """
+    Create a wtforms Form for a given SQLAlchemy model class like
+    :func:`model_form`, but defer the conversion of the model until the form
+    class is first instantiated or introspected::
+
+        UserForm = lazy_model_form(User, db_session)
+        # The fields are generated here, once, even with several threads.
+        form = UserForm(request.form)
+
+    This keeps the cost of generating rarely used forms out of the start-up
+    of the application. The parameters are the same as for :func:`model_form`.
+    """
+    if not hasattr(model, "_sa_class_manager"):
+        raise TypeError("model must be a sqlalchemy mapped model")
+
+    type_name = type_name or str(model.__name__ + "Form")
+    metaclass = _lazy_metaclass(type(base_class))
+    return metaclass(
+        type_name,
+        (base_class,),
+        {
+            "_lazy_fields": functools.partial(
+                model_fields,
+                model,
+                db_session,
+                only,
+                exclude,
+                field_args,
+                converter,
+                exclude_pk=exclude_pk,
+                exclude_fk=exclude_fk,
+                projected=projected,
+            ),
+            "_lazy_lock": threading.Lock(),
+        },
+    )
+
+
+def model_forms(
+    registry,
+    db_session=None,
+    base_class=Form,
+    converter=None,
+    exclude_pk=True,
+    exclude_fk=True,
+    projected=False,
+    max_workers=None,
+    timings=None,
+):
+    """
+    Create wtforms Forms for all the models of a SQLAlchemy registry at once::
+
+        from wtforms_sqlalchemy.orm import model_forms
+        from myapp.models import Base
+        forms = model_forms(Base, db_session)
+        UserForm = forms[User]
+
+    The mappers are configured once beforehand, and all the models share the
+    same converter, so converters are only resolved once per column type.
+
+    :param registry:
+        A SQLAlchemy ``registry``, or a declarative base class.
+    :param max_workers:
+        If set, the forms are generated by a thread pool of that size.
+    :param timings:
+        An optional dictionary which receives the number of seconds spent
+        generating the form of each model, keyed by model.
+
+    The other parameters are passed to :func:`model_form` for each model.
+    Returns a dictionary mapping each model class to its form class.
+    """
+    registry = getattr(registry, "registry", registry)
+    registry.configure()
+    models = sorted(
+        (mapper.class_ for mapper in registry.mappers),
+        key=lambda model: (model.__module__, model.__qualname__),
+    )
+    converter = converter or _get_default_converter()
+
+    def generate(model):
+        start = time.perf_counter()
+        form_class = model_form(
+            model,
+            db_session,
+            base_class,
+            converter=converter,
+            exclude_pk=exclude_pk,
+            exclude_fk=exclude_fk,
+            projected=projected,
+        )
+        return form_class, time.perf_counter() - start
+
+    if max_workers is None:
+        results = map(generate, models)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(generate, models))
+
+    forms = {}
+    for model, (form_class, duration) in zip(models, results, strict=True):
+        forms[model] = form_class
+        if timings is not None:
+            timings[model] = duration
+    return forms
+
+
+def clear_model_form_cache():
+    """Remove the form classes cached by ``model_form(..., cache=True)``."""
+    _cached_model_form.cache_clear()
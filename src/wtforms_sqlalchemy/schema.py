@@ -0,0 +1,259 @@
+"""Serializable schemas of the forms generated from SQLAlchemy models.
+
+A schema describes the fields :func:`~wtforms_sqlalchemy.orm.model_fields`
+generates for a model, with plain dictionaries and lists, so it can be
+computed ahead of time, stored as JSON or with pickle, and turned back into a
+form class without inspecting the model.
+"""
+
+import importlib
+
+from sqlalchemy import inspect as sainspect
+from sqlalchemy import select
+from sqlalchemy.orm import ColumnProperty
+from wtforms import validators
+from wtforms.form import Form
+
+from .fields import AsyncQuerySelectField
+from .fields import AsyncQuerySelectMultipleField
+from .fields import QuerySelectField
+from .fields import QuerySelectMultipleField
+from .orm import _async_session_types
+from .orm import model_fields
+from .orm import ModelConversionError
+
+__all__ = (
+    "model_schema",
+    "schema_form",
+)
+
+SCHEMA_VERSION = 1
+
+_validator_arguments = {
+    validators.Optional: lambda v: {"strip_whitespace": v.string_check(" ") == ""},
+    validators.DataRequired: lambda v: {"message": v.message},
+    validators.InputRequired: lambda v: {"message": v.message},
+    validators.Length: lambda v: {"min": v.min, "max": v.max, "message": v.message},
+    validators.NumberRange: lambda v: {
+        "min": v.min,
+        "max": v.max,
+        "message": v.message,
+    },
+    validators.Regexp: lambda v: {
+        "regex": v.regex.pattern,
+        "flags": v.regex.flags,
+        "message": v.message,
+    },
+    validators.IPAddress: lambda v: {
+        "ipv4": v.ipv4,
+        "ipv6": v.ipv6,
+        "message": v.message,
+    },
+    validators.MacAddress: lambda v: {"message": v.message},
+    validators.UUID: lambda v: {"message": v.message},
+}
+
+# The fields ModelConverter generates for relations, by converter name.
+_relation_field_types = {
+    "MANYTOONE": QuerySelectField,
+    "MANYTOMANY": QuerySelectMultipleField,
+    "ONETOMANY": QuerySelectMultipleField,
+    "ASYNC_MANYTOONE": AsyncQuerySelectField,
+    "ASYNC_MANYTOMANY": AsyncQuerySelectMultipleField,
+    "ASYNC_ONETOMANY": AsyncQuerySelectMultipleField,
+}
+
+
+def model_schema(
+    model,
+    db_session=None,
+    only=None,
+    exclude=None,
+    field_args=None,
+    converter=None,
+    exclude_pk=True,
+    exclude_fk=True,
+    type_name=None,
+):
+    """Generate the schema of the form :func:`~wtforms_sqlalchemy.orm.model_form`
+    would create for a given SQLAlchemy model class::
+
+        schema = model_schema(User, db_session)
+        with open("user_form.json", "w") as f:
+            json.dump(schema, f)
+
+    The parameters are the same as for ``model_form``. A session is still
+    needed to convert relations, but it is not kept in the schema, and the
+    relation fields generated by ``ModelConverter`` are loaded as the
+    synchronous or async fields matching the session given to
+    :func:`schema_form`.
+
+    Validators are stored as their class and arguments, which is only
+    supported for the validators of ``wtforms.validators`` generated by the
+    converters, and functions or classes in field arguments, such as
+    ``get_label``, are stored as their import path, as are the callable
+    defaults of columns, which are called each time a form is created rather
+    than when the schema is generated. Other values must be supported by
+    JSON, and a `TypeError` is raised for those which are not, like lambdas,
+    decimals or dates. The schema can be serialized with JSON and pickle.
+    """
+    field_dict = model_fields(
+        model,
+        db_session,
+        only,
+        exclude,
+        field_args,
+        converter,
+        exclude_pk=exclude_pk,
+        exclude_fk=exclude_fk,
+    )
+    mapper = sainspect(model)
+    return {
+        "version": SCHEMA_VERSION,
+        "type_name": type_name or str(model.__name__ + "Form"),
+        "fields": [
+            _dump_field(name, field, mapper) for name, field in field_dict.items()
+        ],
+    }
+
+
+def schema_form(schema, db_session=None, base_class=Form, type_name=None):
+    """Create a wtforms Form from a schema generated by :func:`model_schema`.
+
+    :param db_session:
+        The SQLAlchemy Session used to query the choices of relation fields,
+        which are async fields if it is an asyncio session.
+    :param base_class:
+        Base form class to extend from. Must be a ``wtforms.Form`` subclass.
+    :param type_name:
+        An optional string to override the type name stored in the schema.
+    """
+    if schema.get("version") != SCHEMA_VERSION:
+        raise ValueError(f"Unsupported form schema version {schema.get('version')!r}.")
+
+    field_dict = {}
+    for spec in schema["fields"]:
+        kwargs = _load_value(spec["kwargs"])
+        kwargs["validators"] = [
+            _import(v["type"])(**v["kwargs"]) for v in spec["validators"]
+        ]
+        field_class = _import(spec["type"])
+        if "model" in spec:
+            if db_session is None:
+                raise ModelConversionError(
+                    f"Cannot load field {spec['name']}, need DB session."
+                )
+            model = _import(spec["model"])
+            is_async = isinstance(db_session, _async_session_types)
+            if field_class in _relation_field_types.values():
+                prefix = "ASYNC_" if is_async else ""
+                field_class = _relation_field_types[prefix + spec["relation"]]
+            if is_async:
+                kwargs["session"] = db_session
+                kwargs["query_factory"] = _select_factory(model)
+            else:
+                kwargs["query_factory"] = _query_factory(db_session, model)
+        field_dict[spec["name"]] = field_class(**kwargs)
+
+    return type(type_name or schema["type_name"], (base_class,), field_dict)
+
+
+def _dump_field(name, field, mapper):
+    kwargs = dict(field.kwargs)
+    spec = {"name": name, "type": _import_path(field.field_class)}
+    spec["validators"] = [
+        _dump_validator(name, v) for v in kwargs.pop("validators", None) or ()
+    ]
+    if "query_factory" in kwargs:
+        del kwargs["query_factory"]
+        # The session of async fields is given to schema_form.
+        kwargs.pop("session", None)
+        relation = mapper.relationships[name]
+        spec["model"] = _import_path(relation.mapper.class_)
+        spec["relation"] = relation.direction.name
+    default = _column_default(name, mapper)
+    if default is not None:
+        kwargs["default"] = default
+    spec["kwargs"] = {key: _dump_value(name, value) for key, value in kwargs.items()}
+    return spec
+
+
+def _column_default(name, mapper):
+    """Return the callable default of the column of field `name`, if any,
+    which the converter called when generating the field."""
+    prop = mapper.attrs.get(name)
+    if not isinstance(prop, ColumnProperty):
+        return None
+    default = getattr(getattr(prop.columns[0], "default", None), "arg", None)
+    if not callable(default):
+        return None
+    # SQLAlchemy wraps the callables which do not take a context argument.
+    default = getattr(default, "__wrapped__", None)
+    if default is None:
+        raise TypeError(f"Cannot serialize the column default of field {name}.")
+    return default
+
+
+def _dump_validator(name, validator):
+    get_arguments = _validator_arguments.get(type(validator))
+    if get_arguments is None:
+        raise TypeError(f"Cannot serialize validator {validator!r} of field {name}.")
+    return {"type": _import_path(type(validator)), "kwargs": get_arguments(validator)}
+
+
+def _dump_value(name, value):
+    if value is None or isinstance(value, bool | int | float | str):
+        return value
+    if isinstance(value, list | tuple):
+        return type(value)(_dump_value(name, v) for v in value)
+    if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        return {k: _dump_value(name, v) for k, v in value.items()}
+    if callable(value):
+        try:
+            return {"__import__": _import_path(value)}
+        except TypeError as e:
+            raise TypeError(f"Cannot serialize {value!r} of field {name}.") from e
+    raise TypeError(f"Cannot serialize {value!r} of field {name}.")
+
+
+def _load_value(value):
+    if isinstance(value, list | tuple):
+        return type(value)(_load_value(v) for v in value)
+    if isinstance(value, dict):
+        if value.keys() == {"__import__"}:
+            return _import(value["__import__"])
+        return {k: _load_value(v) for k, v in value.items()}
+    return value
+
+
+def _import_path(obj):
+    # Methods of builtin classes, like datetime.now, only have the module of
+    # the class they are bound to.
+    module = getattr(obj, "__module__", None) or getattr(
+        getattr(obj, "__self__", None), "__module__", None
+    )
+    path = f"{module}:{getattr(obj, '__qualname__', None)}"
+    try:
+        found = _import(path)
+    except (ImportError, AttributeError):
+        found = None
+    # Methods are bound again each time they are looked up.
+    if found is not obj and found != obj:
+        raise TypeError(f"{obj!r} cannot be imported from its module.")
+    return path
+
+
+def _import(path):
+    module_name, _, qualname = path.partition(":")
+    obj = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _query_factory(db_session, model):
+    return lambda: db_session.query(model)
+
+
+def _select_factory(model):
+    return lambda: select(model)
@@ -0,0 +1,120 @@
+"""Widgets for rendering query-backed fields."""
+
+import itertools
+
+from markupsafe import Markup
+from wtforms import widgets
+from wtforms.widgets import html_params
+
+from .fields import _ChoiceList
+from .fields import QuerySearchSelectField
+from .fields import QuerySelectField
+from .fields import QuerySelectMultipleField
+
+__all__ = ("CachedSelect",)
+
+
+class CachedSelect(widgets.Select):
+    """Renders a :class:`~wtforms_sqlalchemy.fields.QuerySelectField` or a
+    :class:`~wtforms_sqlalchemy.fields.QuerySelectMultipleField` like
+    `wtforms.widgets.Select`, but reuses the markup of its options::
+
+        country = QuerySelectField(query_factory=..., widget=CachedSelect())
+
+    The escaped ``<option>`` elements, and their ``<optgroup>`` structure, are
+    rendered once per list of choices and stored along with it, so forms
+    sharing options through a choice cache also share their markup. Only the
+    selected options are rendered again each time.
+
+    Fields streaming their options with `yield_per`, search fields and
+    subclasses overriding `iter_choices` or `iter_groups` are rendered as with
+    `Select`.
+    """
+
+    def __call__(self, field, **kwargs):
+        choices = _cached_choices(field)
+        if choices is None:
+            return super().__call__(field, **kwargs)
+
+        kwargs.setdefault("id", field.id)
+        if self.multiple:
+            kwargs["multiple"] = True
+        flags = getattr(field, "flags", {})
+        for k in dir(flags):
+            if k in self.validation_attrs and k not in kwargs:
+                kwargs[k] = getattr(flags, k)
+        select_params = html_params(name=field.name, **kwargs)
+        html = [f"<select {select_params}>"]
+
+        selected = field._get_selected_pks()
+        if field.has_groups():
+            for group, options in self._get_markup(choices, True):
+                optgroup_params = html_params(label=group)
+                html.append(f"<optgroup {optgroup_params}>")
+                self._extend_options(html, choices, options, selected)
+                html.append("</optgroup>")
+        else:
+            if field.allow_blank and not isinstance(field, QuerySelectMultipleField):
+                html.append(
+                    self.render_option(
+                        field.blank_value, field.blank_text, field.data is None
+                    )
+                )
+            options = self._get_markup(choices, False)
+            self._extend_options(html, choices, options, selected)
+        html.append("</select>")
+        return Markup("".join(html))
+
+    def _get_markup(self, choices, grouped):
+        """Return the ``(pk, index, markup)`` tuples of the unselected options
+        of `choices`, bucketed by group if `grouped`."""
+        if choices.markup is None:
+            choices.markup = {}
+        key = (type(self), grouped)
+        markup = choices.markup.get(key)
+        if markup is None:
+            options = [
+                (pk, index, self.render_option(pk, label, False, **render_kw))
+                for index, (pk, label, _, render_kw) in enumerate(choices)
+            ]
+            if grouped:
+                markup = _group_options(choices, options)
+            else:
+                markup = options
+            choices.markup[key] = markup
+        return markup
+
+    def _extend_options(self, html, choices, options, selected):
+        for pk, index, markup in options:
+            if pk in selected:
+                _, label, _, render_kw = choices[index]
+                html.append(self.render_option(pk, label, True, **render_kw))
+            else:
+                html.append(markup)
+
+
+def _cached_choices(field):
+    """Return the choice list of `field` if its options can be rendered from
+    cached markup, or `None`."""
+    if (
+        not isinstance(field, QuerySelectField)
+        or isinstance(field, QuerySearchSelectField)
+        or type(field).iter_choices
+        not in (QuerySelectField.iter_choices, QuerySelectMultipleField.iter_choices)
+        or type(field).iter_groups is not QuerySelectField.iter_groups
+        or field._iter_all_choices_streams()
+    ):
+        return None
+    choices = field._get_choices()
+    return choices if isinstance(choices, _ChoiceList) else None
+
+
+def _group_options(choices, options):
+    """Bucket `options` by group, in the order groups first appear, as
+    `QuerySelectField.iter_groups` does for choices which are not streamed."""
+    groups = itertools.repeat(None) if choices.groups is None else choices.groups
+    grouped = zip(groups, options, strict=False)
+    buckets = {}
+    for group, option in grouped:
+        buckets.setdefault(group, []).append(option)
+    return list(buckets.items())
@@ -1,5 +1,6 @@
 from contextlib import contextmanager
 
+from sqlalchemy import event
 from wtforms.validators import StopValidation
 from wtforms.validators import ValidationError
 
@@ -73,3 +74,17 @@ def assert_raises_text(e_type, text):
             ) from e
     else:
         raise AssertionError(f"Expected Exception {e_type!r}, did not get it")
+
+
+@contextmanager
+def count_queries(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
@@ -1,7 +1,19 @@
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+from unittest import IsolatedAsyncioTestCase
+from unittest import skipIf
 from unittest import TestCase
 
 from sqlalchemy import create_engine
 from sqlalchemy import ForeignKey
+from sqlalchemy import func
+from sqlalchemy import select
 from sqlalchemy import types as sqla_types
 from sqlalchemy.dialects.mssql import BIT
 from sqlalchemy.dialects.mysql import YEAR
@@ -10,27 +22,59 @@ from sqlalchemy.dialects.postgresql import MACADDR
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import backref
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import deferred
 from sqlalchemy.orm import registry
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.schema import Column
 from sqlalchemy.schema import ColumnDefault
 from sqlalchemy.schema import Table
 from wtforms import fields
 from wtforms import Form
+from wtforms import widgets
 from wtforms.validators import InputRequired
+from wtforms.validators import Length
 from wtforms.validators import Optional
 from wtforms.validators import Regexp
 
+from wtforms_sqlalchemy.cache import ChoiceCache
+from wtforms_sqlalchemy.cache import ChoiceCacheInvalidator
+from wtforms_sqlalchemy.cache import MemoryChoiceCache
+from wtforms_sqlalchemy.fields import AsyncQuerySelectField
+from wtforms_sqlalchemy.fields import AsyncQuerySelectMultipleField
+from wtforms_sqlalchemy.fields import batch_load_choices
+from wtforms_sqlalchemy.fields import get_pk_from_identity
+from wtforms_sqlalchemy.fields import load_form_choices
+from wtforms_sqlalchemy.fields import prefetch_choices
+from wtforms_sqlalchemy.fields import QuerySearchSelectField
 from wtforms_sqlalchemy.fields import QuerySelectField
 from wtforms_sqlalchemy.fields import QuerySelectMultipleField
+from wtforms_sqlalchemy.instrumentation import add_listener
+from wtforms_sqlalchemy.instrumentation import FieldStats
+from wtforms_sqlalchemy.instrumentation import remove_listener
+from wtforms_sqlalchemy.orm import clear_model_form_cache
+from wtforms_sqlalchemy.orm import converts
+from wtforms_sqlalchemy.orm import lazy_model_form
 from wtforms_sqlalchemy.orm import model_form
+from wtforms_sqlalchemy.orm import model_forms
 from wtforms_sqlalchemy.orm import ModelConversionError
 from wtforms_sqlalchemy.orm import ModelConverter
+from wtforms_sqlalchemy.schema import model_schema
+from wtforms_sqlalchemy.schema import schema_form
+from wtforms_sqlalchemy.widgets import CachedSelect
 
 from .common import contains_validator
+from .common import count_queries
 from .common import DummyPostData
 
+try:
+    import aiosqlite
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from sqlalchemy.ext.asyncio import create_async_engine
+except ImportError:
+    aiosqlite = None
+
 
 class LazySelect:
     def __call__(self, field, **kwargs):
@@ -50,6 +94,24 @@ class AnotherInteger(sqla_types.Integer):
     """Use me to test if MRO works like we want."""
 
 
+SchemaModel = declarative_base()
+
+
+class Country(SchemaModel):
+    __tablename__ = "country"
+    id = Column(sqla_types.Integer, primary_key=True)
+    name = Column(sqla_types.String(50), nullable=False)
+
+
+class City(SchemaModel):
+    __tablename__ = "city"
+    id = Column(sqla_types.Integer, primary_key=True)
+    name = Column(sqla_types.String(50), nullable=False)
+    population = Column(sqla_types.Integer, default=0)
+    country_id = Column(sqla_types.Integer, ForeignKey(Country.id), nullable=False)
+    country = relationship(Country)
+
+
 class TestBase(TestCase):
     def _do_tables(self, mapper, engine):
         mapper_registry = registry()
@@ -237,6 +299,523 @@ class QuerySelectFieldTest(TestBase):
         )
         self.assertEqual(form.a(), [])
 
+    def test_object_index(self):
+        sess = self.Session()
+        self._fill(sess)
+
+        class F(Form):
+            a = QuerySelectField(
+                get_label="name",
+                query_factory=lambda: sess.query(self.Test),
+                widget=LazySelect(),
+            )
+
+        form = F(DummyPostData(a=["2"]))
+        self.assertEqual(form.a._get_object_index(), {"1": 0, "2": 1})
+        self.assertEqual(form.a.data.name, "banana")
+        self.assertTrue(form.validate())
+
+        # Replacing the object list also rebuilds the index
+        sess.add(self.Test(id=3, name="meh"))
+        sess.commit()
+        form = F(DummyPostData(a=["3"]))
+        form.a._get_object_list()
+        form.a._object_list = None
+        self.assertEqual(form.a._get_object_index(), {"1": 0, "2": 1, "3": 2})
+        self.assertEqual(form.a.data.name, "meh")
+
+    def test_query_factory_results(self):
+        sess = self.Session()
+        self._fill(sess)
+
+        class F(Form):
+            a = QuerySelectField(query_factory=lambda: sess.query(self.Test).all())
+            b = QuerySelectMultipleField(
+                query_factory=lambda: sess.query(self.Test).all()
+            )
+
+        form = F(DummyPostData(a=["1"], b=["1", "2"]))
+        with count_queries(self.engine) as queries:
+            self.assertTrue(form.validate())
+            form.a()
+            form.b()
+        self.assertEqual(len(queries), 2)
+
+    def test_pk_lookup(self):
+        sess = self.Session()
+        self._fill(sess)
+
+        class F(Form):
+            a = QuerySelectField(
+                get_label="name",
+                query_factory=lambda: sess.query(self.Test).filter(
+                    self.Test.name != "banana"
+                ),
+                pk_lookup=True,
+                widget=LazySelect(),
+            )
+            b = QuerySelectField(
+                query_factory=lambda: sess.query(self.PKTest),
+                pk_lookup=True,
+                widget=LazySelect(),
+            )
+
+        form = F(DummyPostData(a=["1"], b=["hello2"]))
+        self.assertTrue(form.validate())
+        self.assertEqual(form.a.data.id, 1)
+        self.assertEqual(form.b.data.baz, "banana")
+        self.assertIsNone(form.a._object_list)
+        self.assertIsNone(form.b._object_list)
+        self.assertEqual(form.a(), [("1", "apple", True, {})])
+
+        # The query filters still apply to looked up values
+        form = F(DummyPostData(a=["2"], b=["hello1"]))
+        self.assertFalse(form.validate())
+        self.assertEqual(form.a.errors, ["Not a valid choice"])
+        self.assertIsNone(form.a.data)
+
+        form = F(DummyPostData(a=["fail"], b=["hello1"]))
+        self.assertFalse(form.validate())
+        self.assertEqual(form.a.errors, ["Not a valid choice"])
+
+        # A value which was not found is only looked up once
+        form = F(DummyPostData(a=["2"], b=["hello1"]))
+        with count_queries(self.engine) as queries:
+            self.assertFalse(form.validate())
+            self.assertIsNone(form.a.data)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(form.a(), [("1", "apple", False, {})])
+
+        form = F(a=sess.get(self.Test, 2), b=sess.get(self.PKTest, "hello1"))
+        self.assertFalse(form.validate())
+        self.assertEqual(form.a.errors, ["Not a valid choice"])
+        self.assertEqual(form.b.errors, [])
+        self.assertIsNone(form.a._object_list)
+
+        # Plain lists cannot be filtered and fall back to the full choice list
+        form = F(DummyPostData(a=["1"], b=["hello1"], c=["hello2"]))
+        form.a.query = sess.query(self.Test).all()
+        self.assertEqual(form.a.data.id, 1)
+        self.assertIsNotNone(form.a._object_list)
+
+    def test_limited_query(self):
+        sess = self.Session()
+        self._fill(sess)
+        cache = MemoryChoiceCache()
+
+        def query_factory():
+            return sess.query(self.Test).order_by(self.Test.id).limit(1)
+
+        class F(Form):
+            a = QuerySelectField(query_factory=query_factory, pk_lookup=True)
+            b = QuerySelectField(query_factory=query_factory, keep_objects=False)
+            c = QuerySelectField(query_factory=query_factory, yield_per=1)
+            d = QuerySelectField(
+                query_factory=query_factory, choice_cache=cache, cache_key="tests"
+            )
+            e = QuerySearchSelectField(query_factory=query_factory)
+            f = QuerySelectMultipleField(query_factory=query_factory, pk_lookup=True)
+            g = QuerySelectField(
+                get_label="name",
+                query_factory=lambda: (
+                    sess.query(self.Test.id, self.Test.name)
+                    .order_by(self.Test.id)
+                    .limit(1)
+                ),
+            )
+
+        names = "abcdeg"
+        form = F(DummyPostData({name: ["1"] for name in names}, f=["1"]))
+        self.assertTrue(form.validate())
+        self.assertEqual([form[name].data.id for name in names], [1] * 6)
+        self.assertIsInstance(form.g.data, self.Test)
+        self.assertEqual([obj.id for obj in form.f.data], [1])
+
+        form = F(DummyPostData({name: ["2"] for name in names}, f=["1", "2"]))
+        self.assertFalse(form.validate())
+        self.assertEqual(set(form.errors), set("abcdefg"))
+
+    def test_yield_per(self):
+        sess = self.Session()
+        self._fill(sess)
+
+        class F(Form):
+            a = QuerySelectField(
+                get_label="name",
+                get_group=lambda obj: obj.name[0],
+                query_factory=lambda: sess.query(self.Test),
+                yield_per=1,
+                widget=LazySelect(),
+            )
+            b = QuerySelectMultipleField(
+                get_label="name",
+                query_factory=lambda: sess.query(self.Test),
+                yield_per=1,
+                widget=LazySelect(),
+            )
+
+        form = F(DummyPostData(a=["2"], b=["1", "2"]))
+        self.assertEqual(
+            form.a(), [("1", "apple", False, {}), ("2", "banana", True, {})]
+        )
+        self.assertEqual(
+            [(g, list(c)) for g, c in form.a.iter_groups()],
+            [
+                ("a", [("1", "apple", False, {})]),
+                ("b", [("2", "banana", True, {})]),
+            ],
+        )
+        self.assertEqual(
+            form.b(), [("1", "apple", True, {}), ("2", "banana", True, {})]
+        )
+        self.assertTrue(form.validate())
+        self.assertIsNone(form.a._object_list)
+        self.assertIsNone(form.a._choices)
+        self.assertIsNone(form.b._object_list)
+
+    def test_reuses_options(self):
+        sess = self.Session()
+        self._fill(sess)
+        calls = []
+
+        def get_group(obj):
+            calls.append(obj)
+            return obj.name[0]
+
+        class F(Form):
+            a = QuerySelectField(
+                get_label="name",
+                get_group=get_group,
+                query_factory=lambda: sess.query(self.Test),
+                widget=LazySelect(),
+            )
+
+        form = F(a=self.Test(id=2, name="copy"))
+        for _ in range(2):
+            self.assertEqual(
+                [(g, list(c)) for g, c in form.a.iter_groups()],
+                [
+                    ("a", [("1", "apple", False, {})]),
+                    ("b", [("2", "banana", True, {})]),
+                ],
+            )
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(form.validate())
+
+    def test_order_groups(self):
+        SchemaModel.metadata.create_all(bind=self.engine)
+        sess = self.Session()
+        sess.add_all(
+            [
+                City(id=1, name="Lyon", country_id=2),
+                City(id=2, name="Arequipa", country_id=1),
+                City(id=3, name="Cusco", country_id=1),
+                City(id=4, name="Brest", country_id=2),
+            ]
+        )
+        sess.commit()
+
+        class F(Form):
+            a = QuerySelectField(
+                get_label="name",
+                get_group=City.country_id,
+                query_factory=lambda: sess.query(City).order_by(City.id.desc()),
+                widget=LazySelect(),
+            )
+            b = QuerySelectField(
+                get_label="name",
+                get_group="country_id",
+                query_factory=lambda: sess.query(City).order_by(City.id),
+                widget=LazySelect(),
+            )
+            c = QuerySelectField(
+                get_label=lambda city: city.name,
+                get_group=City.country_id,
+                query_factory=lambda: sess.query(City).order_by(City.id.desc()),
+                yield_per=10,
+            )
+            d = QuerySelectField(
+                get_label="name",
+                get_group=City.country_id,
+                query_factory=lambda: sess.query(City).order_by(City.id).limit(3),
+                yield_per=10,
+            )
+
+        def groups(field):
+            return [(g, [c[1] for c in cs]) for g, cs in field.iter_groups()]
+
+        form = F(DummyPostData(a="3"))
+        self.assertTrue(form.a.order_groups)
+        self.assertFalse(form.b.order_groups)
+        with count_queries(self.engine) as statements:
+            self.assertEqual(
+                groups(form.a), [(1, ["Arequipa", "Cusco"]), (2, ["Brest", "Lyon"])]
+            )
+        self.assertIn(
+            "ORDER BY city.country_id, city.name, city.id DESC", statements[0]
+        )
+        self.assertEqual(form.a.data.name, "Cusco")
+        self.assertEqual(
+            groups(form.b), [(2, ["Lyon", "Brest"]), (1, ["Arequipa", "Cusco"])]
+        )
+        # The query's own order breaks the ties between options of a group.
+        self.assertEqual(
+            groups(form.c), [(1, ["Cusco", "Arequipa"]), (2, ["Brest", "Lyon"])]
+        )
+        # Limited queries are left unordered and their options bucketed.
+        self.assertEqual(groups(form.d), [(2, ["Lyon"]), (1, ["Arequipa", "Cusco"])])
+
+        for get_group in (City.__table__.c.country_id, func.lower(City.name)):
+            with self.assertRaises(TypeError):
+                QuerySelectField(get_group=get_group).bind(Form(), "a")
+
+    def test_eager_load(self):
+        Model = declarative_base()
+
+        class Parent(Model):
+            __tablename__ = "parent"
+            id = Column(sqla_types.Integer, primary_key=True)
+            name = deferred(Column(sqla_types.String))
+            children = relationship("Child", back_populates="parent")
+
+        class Child(Model):
+            __tablename__ = "child"
+            id = Column(sqla_types.Integer, primary_key=True)
+            parent_id = Column(sqla_types.Integer, ForeignKey(Parent.id))
+            parent = relationship(Parent, back_populates="children")
+
+        Model.metadata.create_all(bind=self.engine)
+        sess = self.Session()
+        for i in range(1, 4):
+            sess.add(Parent(id=i, name=f"parent {i}", children=[Child(id=i)]))
+        sess.commit()
+        sess.close()
+
+        class F(Form):
+            a = QuerySelectField(
+                get_label="parent.name",
+                query_factory=lambda: sess.query(Child),
+                widget=LazySelect(),
+            )
+            b = QuerySelectField(
+                get_label="name",
+                query_factory=lambda: sess.query(Parent),
+                widget=LazySelect(),
+            )
+            c = QuerySelectField(
+                get_label="parent.name",
+                query_factory=lambda: sess.query(Child),
+                eager_load=False,
+                widget=LazySelect(),
+            )
+
+        form = F()
+        with count_queries(self.engine) as statements:
+            self.assertEqual([c[1] for c in form.a()][0], "parent 1")
+        self.assertEqual(len(statements), 1)
+        sess.expunge_all()
+        with count_queries(self.engine) as statements:
+            self.assertEqual([c[1] for c in form.b()][2], "parent 3")
+        self.assertEqual(len(statements), 1)
+        sess.expunge_all()
+        with count_queries(self.engine) as statements:
+            form.c()
+        self.assertEqual(len(statements), 7)
+
+    def test_keep_objects(self):
+        sess = self.Session()
+        self._fill(sess)
+
+        class F(Form):
+            a = QuerySelectField(
+                get_label="name",
+                query_factory=lambda: sess.query(self.Test),
+                keep_objects=False,
+                widget=LazySelect(),
+            )
+            b = QuerySelectMultipleField(
+                get_label="name",
+                query_factory=lambda: sess.query(self.Test),
+                keep_objects=False,
+                widget=LazySelect(),
+            )
+
+        form = F(DummyPostData(a=["2"], b=["1", "3"]))
+        self.assertEqual(
+            form.a(), [("1", "apple", False, {}), ("2", "banana", True, {})]
+        )
+        self.assertIsNone(form.a._object_list)
+        choices = form.a._choices
+        self.assertEqual((choices.groups, choices.render_kws), (None, None))
+        self.assertEqual(pickle.loads(pickle.dumps(choices)), choices)
+        self.assertEqual(form.a.data.name, "banana")
+        self.assertFalse(form.validate())
+        self.assertEqual(list(form.errors), ["b"])
+
+        form = F(DummyPostData(a=["1"], b=["1", "2"]))
+        self.assertTrue(form.validate())
+
+    def test_cached_select(self):
+        sess = self.Session()
+        self._fill(sess)
+        sess.add(self.Test(id=3, name="avocado"))
+        sess.commit()
+        cache = MemoryChoiceCache()
+
+        def make_form(widget, multiple_widget, formdata):
+            class F(Form):
+                a = QuerySelectField(
+                    get_label="name",
+                    get_render_kw=lambda obj: {"data-id": obj.id},
+                    query_factory=lambda: sess.query(self.Test),
+                    allow_blank=True,
+                    blank_text="<none>",
+                    widget=widget,
+                )
+                b = QuerySelectField(
+                    get_label="name",
+                    get_group=lambda obj: obj.name[0],
+                    query_factory=lambda: sess.query(self.Test),
+                    choice_cache=cache,
+                    cache_key="tests",
+                    widget=widget,
+                )
+                c = QuerySelectMultipleField(
+                    get_label="name",
+                    get_group=self.Test.name,
+                    query_factory=lambda: sess.query(self.Test),
+                    widget=multiple_widget,
+                )
+
+            return F(DummyPostData(formdata))
+
+        for formdata in ({}, {"a": "1", "b": "2", "c": ["1", "3"]}):
+            expected = make_form(
+                widgets.Select(), widgets.Select(multiple=True), formdata
+            )
+            form = make_form(CachedSelect(), CachedSelect(multiple=True), formdata)
+            for name in ("a", "b", "c"):
+                self.assertEqual(form[name](), expected[name]())
+                self.assertEqual(form[name](class_="x"), expected[name](class_="x"))
+            self.assertIn("<optgroup", form.b())
+
+        # The markup is stored with the cached choices of other forms.
+        choices = cache.get("tests")
+        self.assertEqual(len(choices.markup), 1)
+        form = make_form(CachedSelect(), CachedSelect(multiple=True), {})
+        self.assertIn('value="2">banana', form.b())
+        self.assertIs(form.b._choices.markup, choices.markup)
+
+        # Limited queries are not ordered by group, their options are bucketed.
+        sess.add(self.Test(id=4, name="apple"))
+        sess.commit()
+
+        def make_limited_form(widget):
+            class F(Form):
+                a = QuerySelectField(
+                    get_label="id",
+                    get_group=self.Test.name,
+                    query_factory=lambda: (
+                        sess.query(self.Test).order_by(self.Test.id).limit(4)
+                    ),
+                    widget=widget,
+                )
+
+            return F()
+
+        html = make_limited_form(CachedSelect()).a()
+        self.assertEqual(html, make_limited_form(widgets.Select()).a())
+        self.assertEqual(html.count("<optgroup"), 3)
+
+    def test_batch_load_choices(self):
+        sess = self.Session()
+        self._fill(sess)
+
+        class F(Form):
+            a = QuerySelectField(
+                get_label="name",
+                get_group="name",
+                query_factory=lambda: sess.query(self.Test).order_by(
+                    self.Test.id.desc()
+                ),
+                widget=LazySelect(),
+            )
+            b = QuerySelectMultipleField(
+                get_label="baz",
+                query_factory=lambda: sess.query(self.PKTest).filter_by(baz="apple"),
+                widget=LazySelect(),
+            )
+            c = QuerySelectField(query_factory=lambda: sess.query(self.PKTest))
+            d = QuerySelectField(
+                get_label="id", query_factory=lambda: sess.query(self.Test)
+            )
+
+        form = F(DummyPostData(a=["1"], b=["hello1"], c=["hello2"], d=["1"]))
+        with count_queries(self.engine) as statements:
+            batch_load_choices(form)
+            self.assertEqual(
+                form.a(), [("2", "banana", False, {}), ("1", "apple", True, {})]
+            )
+            self.assertEqual([g for g, _ in form.a.iter_groups()], ["banana", "apple"])
+            self.assertEqual(form.b(), [("hello1", "apple", True, {})])
+        self.assertEqual(len(statements), 3)
+        self.assertIn("UNION ALL", statements[0])
+        self.assertIsNone(form.a._object_list)
+        self.assertIsNone(form.c._choices)
+        self.assertIsNone(form.d._choices)
+        self.assertTrue(form.validate())
+
+        form = F(DummyPostData(b=["hello2"]))
+        batch_load_choices(form)
+        self.assertFalse(form.validate())
+        self.assertEqual(set(form.errors), {"a", "b", "c", "d"})
+
+
+class GetPkFromIdentityTest(TestCase):
+    def test_matches_identity_key(self):
+        from sqlalchemy.orm.util import identity_key
+
+        Model = declarative_base()
+
+        class Single(Model):
+            __tablename__ = "single"
+            id = Column(sqla_types.Integer, primary_key=True)
+
+        class Composite(Model):
+            __tablename__ = "composite"
+            region = Column("region_code", sqla_types.String, primary_key=True)
+            number = Column(sqla_types.Integer, primary_key=True)
+
+        engine = create_engine("sqlite:///:memory:", echo=False)
+        Model.metadata.create_all(bind=engine)
+        sess = sessionmaker(bind=engine)()
+        self.addCleanup(engine.dispose)
+        self.addCleanup(sess.close)
+        sess.add_all([Single(id=7), Composite(region="eu", number=3)])
+        sess.commit()
+
+        for obj in sess.query(Single).all() + sess.query(Composite).all():
+            key = ":".join(str(x) for x in identity_key(instance=obj)[1])
+            self.assertEqual(get_pk_from_identity(obj), key)
+        self.assertEqual(get_pk_from_identity(sess.get(Composite, ("eu", 3))), "eu:3")
+
+    def test_remapped_class(self):
+        mapper_registry = registry()
+        table = Table(
+            "remapped",
+            mapper_registry.metadata,
+            Column("id", sqla_types.Integer, primary_key=True),
+            Column("code", sqla_types.String),
+        )
+        Remapped = type("Remapped", (Base,), {})
+
+        mapper_registry.map_imperatively(Remapped, table)
+        self.assertEqual(get_pk_from_identity(Remapped(id=1, code="a")), "1")
+        mapper_registry.dispose()
+        mapper_registry.map_imperatively(Remapped, table, primary_key=[table.c.code])
+        self.addCleanup(mapper_registry.dispose)
+        self.assertEqual(get_pk_from_identity(Remapped(id=1, code="a")), "a")
+
 
 class QuerySelectMultipleFieldTest(TestBase):
     def setUp(self):
@@ -282,6 +861,54 @@ class QuerySelectMultipleFieldTest(TestBase):
         self.assertEqual([x.id for x in form.a.data], [1])
         self.assertFalse(form.validate())
 
+    def test_unknown_values_before_render(self):
+        form = self.F(DummyPostData(a=["1", "3"]))
+        form.a.query = self.sess.query(self.Test)
+        self.assertFalse(form.validate())
+        self.assertEqual(form.a.errors, ["Not a valid choice"])
+        self.assertEqual([x.id for x in form.a.data], [1])
+
+    def test_pk_lookup(self):
+        class F(Form):
+            a = QuerySelectMultipleField(
+                get_label="name",
+                query_factory=lambda: self.sess.query(self.Test),
+                pk_lookup=True,
+                widget=LazySelect(),
+            )
+
+        form = F(DummyPostData(a=["2", "1"]))
+        self.assertEqual([1, 2], [v.id for v in form.a.data])
+        self.assertTrue(form.validate())
+        self.assertIsNone(form.a._object_list)
+
+        form = F(DummyPostData(a=["1", "3"]))
+        self.assertEqual([1], [v.id for v in form.a.data])
+        self.assertFalse(form.validate())
+
+        form = F(a=[self.sess.get(self.Test, 1)])
+        self.assertTrue(form.validate())
+        self.assertIsNone(form.a._object_list)
+
+    def test_matches_by_pk(self):
+        class F(Form):
+            a = QuerySelectMultipleField(
+                get_label="name",
+                query_factory=lambda: self.sess.query(self.Test),
+                widget=LazySelect(),
+            )
+
+        # Instances from another session compare by primary key
+        other = self.Test(id=2, name="banana")
+        form = F(a=[other])
+        self.assertEqual(
+            form.a(), [("1", "apple", False, {}), ("2", "banana", True, {})]
+        )
+        self.assertTrue(form.validate())
+
+        form = F(a=[self.Test(id=3, name="meh")])
+        self.assertFalse(form.validate())
+
     def test_single_default_value(self):
         first_test = self.sess.get(self.Test, 2)
 
@@ -301,6 +928,385 @@ class QuerySelectMultipleFieldTest(TestBase):
         self.assertTrue(form.validate())
 
 
+class QuerySearchSelectFieldTest(TestBase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        self._do_tables(None, self.engine)
+        self.sess = sessionmaker(bind=self.engine)()
+        names = ["apple", "banana", "cherry", "grape", "mango", "banana_split"]
+        for i, name in enumerate(names, 1):
+            self.sess.add(self.Test(id=i, name=name))
+        self.sess.commit()
+
+        class F(Form):
+            a = QuerySearchSelectField(
+                get_label="name",
+                query_factory=lambda: self.sess.query(self.Test).order_by(self.Test.id),
+                page_size=2,
+                allow_blank=True,
+                widget=LazySelect(),
+            )
+
+        self.F = F
+
+    def tearDown(self):
+        self.sess.close()
+        self.engine.dispose()
+
+    def test_render(self):
+        form = self.F(a=self.sess.get(self.Test, 5))
+        self.assertEqual(
+            form.a(),
+            [
+                ("__None", "", False, {}),
+                ("5", "mango", True, {}),
+                ("1", "apple", False, {}),
+                ("2", "banana", False, {}),
+            ],
+        )
+        self.assertIsNone(form.a._object_list)
+
+    def test_get_page(self):
+        field = self.F().a
+        self.assertEqual(
+            field.get_page(),
+            {"options": [("1", "apple"), ("2", "banana")], "more": True},
+        )
+        self.assertEqual(
+            field.get_page(offset=4),
+            {"options": [("5", "mango"), ("6", "banana_split")], "more": False},
+        )
+        self.assertEqual(
+            field.get_page("AN", limit=5),
+            {
+                "options": [("2", "banana"), ("5", "mango"), ("6", "banana_split")],
+                "more": False,
+            },
+        )
+        # Wildcards are matched literally
+        self.assertEqual(
+            field.get_page("a_s"), {"options": [("6", "banana_split")], "more": False}
+        )
+        self.assertEqual(field.get_page("%"), {"options": [], "more": False})
+
+        field.max_page_size = 3
+        self.assertEqual(len(field.get_page(limit=10**9)["options"]), 3)
+        self.assertEqual(field.get_page(offset=-1, limit=-1)["options"], [])
+
+    def test_search_by_default(self):
+        SchemaModel.metadata.create_all(bind=self.engine)
+        self.sess.add(City(id=1, name="Lima", country=Country(id=1, name="Peru")))
+        self.sess.commit()
+
+        class F(Form):
+            a = QuerySearchSelectField(
+                get_label="country.name",
+                query_factory=lambda: self.sess.query(City),
+            )
+            b = QuerySearchSelectField(
+                get_label="name", query_factory=lambda: self.sess.query(City)
+            )
+
+        # Dotted labels are not columns which can be searched
+        form = F()
+        self.assertRaises(TypeError, form.a.get_page, "peru")
+        self.assertEqual(form.a.get_page(), {"options": [("1", "Peru")], "more": False})
+        self.assertEqual(
+            form.b.get_page("li"), {"options": [("1", "Lima")], "more": False}
+        )
+
+    def test_validate(self):
+        form = self.F(DummyPostData(a=["4"]))
+        self.assertTrue(form.validate())
+        self.assertEqual(form.a.data.name, "grape")
+        self.assertIsNone(form.a._object_list)
+
+        form = self.F(DummyPostData(a=["7"]))
+        self.assertFalse(form.validate())
+        self.assertEqual(form.a.errors, ["Not a valid choice"])
+
+
+class InstrumentationTest(TestBase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        self._do_tables(None, self.engine)
+        self.sess = sessionmaker(bind=self.engine)()
+        self._fill(self.sess)
+        self.stats = FieldStats()
+        add_listener(self.stats)
+
+    def tearDown(self):
+        remove_listener(self.stats)
+        self.sess.close()
+        self.engine.dispose()
+
+    def test_field_stats(self):
+        cache = MemoryChoiceCache()
+
+        class F(Form):
+            a = QuerySelectField(
+                get_label="name",
+                query_factory=lambda: self.sess.query(self.Test),
+                choice_cache=cache,
+                cache_key="tests",
+            )
+            b = QuerySelectMultipleField(
+                query_factory=lambda: self.sess.query(self.PKTest),
+                pk_lookup=True,
+            )
+
+        for _ in range(2):
+            form = F(DummyPostData(a="1", b=["hello1"]))
+            form.a()
+            self.assertTrue(form.validate())
+
+        a, b = self.stats.fields["a"], self.stats.fields["b"]
+        self.assertEqual((a["loads"], a["rows"]), (1, 2))
+        self.assertEqual((a["cache_hits"], a["cache_misses"]), (1, 1))
+        self.assertEqual((a["renders"], a["lookups"], a["lookup_rows"]), (2, 1, 1))
+        self.assertGreater(a["render_seconds"], 0)
+        self.assertEqual((b["loads"], b["renders"], b["lookups"]), (0, 0, 2))
+
+        model_form(City, self.sess)
+        self.assertEqual(self.stats.forms[City]["count"], 1)
+
+        remove_listener(self.stats)
+        self.stats.reset()
+        F(DummyPostData(a="1")).a()
+        model_form(City, self.sess)
+        self.assertEqual((self.stats.fields, self.stats.forms), ({}, {}))
+
+
+class MemoryChoiceCacheTest(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.cache = MemoryChoiceCache(maxsize=2, ttl=10, timer=lambda: self.now)
+
+    def test_abstract_methods(self):
+        class IncompleteCache(ChoiceCache):
+            def get(self, key):
+                return None
+
+        self.assertRaises(TypeError, IncompleteCache)
+
+    def test_lru_eviction(self):
+        self.cache.set("a", [1])
+        self.cache.set("b", [2])
+        self.assertEqual(self.cache.get("a"), [1])
+        self.cache.set("c", [3])
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), [1])
+        self.assertEqual(self.cache.get("c"), [3])
+
+    def test_ttl(self):
+        self.cache.set("a", [1])
+        self.cache.set("b", [2], ttl=20)
+        self.now = 10
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("b"), [2])
+        self.now = 20
+        self.assertIsNone(self.cache.get("b"))
+
+    def test_invalidation(self):
+        self.cache.set("a", [1])
+        self.cache.set("b", [2])
+        self.cache.delete("a")
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("b"))
+
+    def test_model_tracking(self):
+        for key in ("a", "b", "c"):
+            self.cache.set(key, [key])
+            self.cache.track(key, (City, Country))
+        self.assertEqual(
+            self.cache._model_keys, {City: {"b", "c"}, Country: {"b", "c"}}
+        )
+
+        # Dropped values are no longer tracked
+        self.cache.delete("b")
+        self.now = 10
+        self.assertIsNone(self.cache.get("c"))
+        self.assertEqual((self.cache._model_keys, self.cache._key_models), ({}, {}))
+
+        self.now = 0
+        self.cache.set("a", [1])
+        self.cache.set("b", [2])
+        self.cache.track("a", (City,))
+        self.cache.track("b", (City, Country))
+        self.cache.invalidate_models((Country,))
+        self.assertEqual(self.cache.get("a"), [1])
+        self.assertEqual(self.cache._model_keys, {City: {"a"}})
+
+
+class ChoiceCacheFieldTest(TestBase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        self._do_tables(None, self.engine)
+        self.sess = sessionmaker(bind=self.engine)()
+        self._fill(self.sess)
+        self.cache = MemoryChoiceCache()
+
+        class F(Form):
+            a = QuerySelectField(
+                get_label="name",
+                get_render_kw=lambda obj: {"data_id": obj.id},
+                query_factory=lambda: self.sess.query(self.Test),
+                choice_cache=self.cache,
+                cache_key="tests",
+                widget=LazySelect(),
+            )
+
+        self.F = F
+
+    def tearDown(self):
+        self.sess.close()
+        self.engine.dispose()
+
+    def test_query_results(self):
+        class F(Form):
+            a = QuerySelectField(
+                get_label="name",
+                query_factory=lambda: self.sess.query(self.Test).all(),
+                choice_cache=self.cache,
+                cache_key="tests",
+                widget=LazySelect(),
+            )
+            b = QuerySelectField(
+                get_label="name",
+                query_factory=lambda: self.sess.query(self.Test).all(),
+                choice_cache=self.cache,
+                cache_key="tests-b",
+                cache_version=lambda query: len(query),
+                widget=LazySelect(),
+            )
+
+        # The results are only loaded once on a cache miss.
+        for name in ("a", "b"):
+            with count_queries(self.engine) as queries:
+                self.assertEqual(len(F()[name]()), 2)
+            self.assertEqual(len(queries), 1)
+
+    def test_cache_version(self):
+        class F(Form):
+            a = QuerySelectField(
+                get_label="name",
+                query_factory=lambda: self.sess.query(self.Test),
+                choice_cache=self.cache,
+                cache_key="tests",
+                cache_version=(func.count(), func.max(self.Test.name)),
+                widget=LazySelect(),
+            )
+            b = QuerySelectField(
+                get_label="name",
+                query_factory=lambda: self.sess.query(self.Test),
+                choice_cache=self.cache,
+                cache_key="tests-b",
+                cache_version=lambda query: versions[-1],
+                widget=LazySelect(),
+            )
+            c = QuerySelectField(
+                get_label="name",
+                query_factory=lambda: (
+                    self.sess.query(self.Test).order_by(self.Test.id).offset(1)
+                ),
+                choice_cache=self.cache,
+                cache_key="tests-c",
+                cache_version=func.max(self.Test.name),
+                widget=LazySelect(),
+            )
+
+        versions = [1]
+        with count_queries(self.engine) as queries:
+            self.assertEqual(len(F().a()), 2)
+            self.assertEqual(len(F().a()), 2)
+        self.assertEqual(len(queries), 3)
+        self.assertIn("count(*)", queries[2])
+
+        self.sess.execute(self.Test.__table__.update().values(name="cherry"))
+        with count_queries(self.engine) as queries:
+            self.assertEqual([c[1] for c in F().a()], ["cherry", "cherry"])
+        self.assertEqual(len(queries), 2)
+
+        with count_queries(self.engine) as queries:
+            F().b()
+            F().b()
+            versions.append(2)
+            F().b()
+        self.assertEqual(len(queries), 2)
+
+        with count_queries(self.engine) as queries:
+            self.assertEqual([c[1] for c in F().c()], ["cherry"])
+            self.assertEqual([c[1] for c in F().c()], ["cherry"])
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn("OFFSET", queries[2])
+
+    def test_cached_choices(self):
+        expected = [
+            ("1", "apple", False, {"data_id": 1}),
+            ("2", "banana", True, {"data_id": 2}),
+        ]
+        form = self.F(a=self.sess.get(self.Test, 2))
+        with count_queries(self.engine) as queries:
+            self.assertEqual(form.a(), expected)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            self.cache.get("tests"),
+            [
+                ("1", "apple", None, {"data_id": 1}),
+                ("2", "banana", None, {"data_id": 2}),
+            ],
+        )
+
+        # Other forms render from the cache
+        self.sess.add(self.Test(id=3, name="meh"))
+        self.sess.commit()
+        form = self.F(a=self.sess.get(self.Test, 2))
+        with count_queries(self.engine) as queries:
+            self.assertEqual(form.a(), expected)
+        self.assertEqual(queries, [])
+
+        self.cache.delete("tests")
+        form = self.F()
+        with count_queries(self.engine) as queries:
+            self.assertEqual(len(form.a()), 3)
+        self.assertEqual(len(queries), 1)
+
+    def test_invalidate_on_commit(self):
+        invalidator = ChoiceCacheInvalidator(self.cache)
+        invalidator.listen(self.sess)
+        self.addCleanup(invalidator.remove, self.sess)
+
+        self.F().a()
+        self.assertEqual(self.cache._model_keys, {self.Test: {"tests"}})
+
+        # Changes to other models and rolled back changes are ignored
+        self.sess.add(self.PKTest(foobar="hello3", baz="cherry"))
+        self.sess.commit()
+        self.sess.add(self.Test(id=3, name="meh"))
+        self.sess.flush()
+        self.sess.rollback()
+        self.assertIsNotNone(self.cache.get("tests"))
+
+        self.sess.get(self.Test, 1).name = "apricot"
+        self.sess.flush()
+        self.assertIsNotNone(self.cache.get("tests"))
+        self.sess.commit()
+        self.assertIsNone(self.cache.get("tests"))
+        self.assertEqual(self.F().a()[0], ("1", "apricot", False, {"data_id": 1}))
+
+    def test_cached_formdata(self):
+        self.F().a()
+        form = self.F(DummyPostData(a=["2"]))
+        self.assertTrue(form.validate())
+        self.assertEqual(form.a.data.name, "banana")
+        self.assertIsNone(form.a._object_list)
+
+        form = self.F(DummyPostData(a=["3"]))
+        self.assertFalse(form.validate())
+
+
 class ModelFormTest(TestCase):
     def setUp(self):
         Model = declarative_base()
@@ -346,6 +1352,7 @@ class ModelFormTest(TestCase):
                 backref=backref("students", lazy="dynamic"),
             )
 
+        self.Model = Model
         self.School = School
         self.Student = Student
         self.Course = Course
@@ -399,6 +1406,7 @@ class ModelFormTest(TestCase):
     def test_convert_many_to_one(self):
         student_form = model_form(self.Student, self.sess)()
         assert isinstance(student_form.current_school, QuerySelectField)
+        assert student_form.current_school.model is self.School
 
     def test_convert_one_to_many(self):
         school_form = model_form(self.School, self.sess)()
@@ -408,6 +1416,151 @@ class ModelFormTest(TestCase):
         student_form = model_form(self.Student, self.sess)()
         assert isinstance(student_form.courses, QuerySelectMultipleField)
 
+    def test_custom_relation_converter(self):
+        class RelationField(fields.SelectField):
+            def __init__(self, query_factory, allow_blank, **kwargs):
+                super().__init__(**kwargs)
+
+        class RelationConverter(ModelConverter):
+            @converts("MANYTOONE")
+            def conv_ManyToOne(self, field_args, **extra):
+                return RelationField(**field_args)
+
+        form_class = model_form(self.Student, self.sess, converter=RelationConverter())
+        student_form = form_class()
+        assert isinstance(student_form.current_school, RelationField)
+        self.assertEqual(student_form.courses.model, self.Course)
+
+    def test_projected(self):
+        self.sess.add_all(
+            [self.School(id=1, name="north"), self.School(id=2, name="south")]
+        )
+        self.sess.commit()
+        field_args = {
+            "current_school": {"get_label": "name", "widget": LazySelect()},
+            "courses": {"get_label": "name"},
+        }
+        form_class = model_form(
+            self.Student, self.sess, field_args=field_args, projected=True
+        )
+
+        form = form_class(DummyPostData(current_school=["2"]))
+        with count_queries(self.engine) as queries:
+            self.assertEqual(
+                form.current_school(),
+                [("1", "north", False, {}), ("2", "south", True, {})],
+            )
+        self.assertEqual(len(queries), 2)
+        self.assertIn(
+            "SELECT school.id AS school_id, school.name AS school_name \nFROM school",
+            queries,
+        )
+        self.assertIsInstance(form.current_school.data, self.School)
+        self.assertEqual(form.current_school.data.name, "south")
+        form.validate()
+        self.assertEqual(form.current_school.errors, [])
+
+        form = form_class(DummyPostData(current_school=["3"]))
+        form.validate()
+        self.assertEqual(form.current_school.errors, ["Not a valid choice"])
+
+        # Without a column label, whole objects are loaded
+        form = model_form(self.Student, self.sess, projected=True)()
+        self.assertIsInstance(form.current_school._get_object_list()[0][1], self.School)
+
+    def test_cache(self):
+        clear_model_form_cache()
+        self.addCleanup(clear_model_form_cache)
+        db_session = scoped_session(sessionmaker(bind=self.engine))
+        self.addCleanup(db_session.remove)
+
+        form_class = model_form(self.Student, db_session, cache=True)
+        self.assertIs(model_form(self.Student, db_session, cache=True), form_class)
+        self.assertIsNot(model_form(self.Student, db_session), form_class)
+        self.assertIsNot(
+            model_form(self.Student, db_session, exclude=["dob"], cache=True),
+            form_class,
+        )
+        self.assertIs(
+            model_form(self.Student, db_session, exclude=["dob"], cache=True),
+            model_form(self.Student, db_session, exclude=("dob",), cache=True),
+        )
+        field_args = {"full_name": {"label": "Name"}}
+        self.assertIsNot(
+            model_form(self.Student, db_session, field_args=field_args, cache=True),
+            model_form(self.Student, db_session, field_args=field_args, cache=True),
+        )
+        self.assertIs(
+            model_form(self.Course, exclude=["students"], cache=True),
+            model_form(self.Course, exclude=["students"], cache=True),
+        )
+
+        # The classes of plain sessions would keep them alive
+        self.assertIsNot(
+            model_form(self.Student, self.sess, cache=True),
+            model_form(self.Student, self.sess, cache=True),
+        )
+
+        clear_model_form_cache()
+        self.assertIsNot(model_form(self.Student, db_session, cache=True), form_class)
+
+    def test_model_forms(self):
+        timings = {}
+        forms = model_forms(self.Model, self.sess, timings=timings)
+        self.assertEqual(set(forms), {self.Course, self.School, self.Student})
+        self.assertEqual(set(timings), set(forms))
+        student_form = forms[self.Student]()
+        assert isinstance(student_form.current_school, QuerySelectField)
+        assert "id" not in student_form._fields
+
+        forms = model_forms(
+            self.Model.registry, self.sess, exclude_pk=False, max_workers=2
+        )
+        self.assertEqual(set(forms), {self.Course, self.School, self.Student})
+        assert "id" in forms[self.School]()._fields
+
+    def test_lazy_model_form(self):
+        form_class = lazy_model_form(self.Course)
+        self.assertEqual(form_class.__name__, "CourseForm")
+        self.assertIsNotNone(form_class.__dict__["_lazy_fields"])
+        # The conversion error only happens when the form is used
+        self.assertRaises(ModelConversionError, form_class)
+        self.assertRaises(ModelConversionError, getattr, form_class, "name")
+
+        form_class = lazy_model_form(self.Student, self.sess)
+        self.assertNotIn("full_name", form_class.__dict__)
+        self.assertTrue(hasattr(form_class, "full_name"))
+        self.assertIn("full_name", form_class.__dict__)
+        self.assertIsNone(form_class.__dict__["_lazy_fields"])
+        self.assertFalse(hasattr(form_class, "missing"))
+
+        class StudentForm(lazy_model_form(self.Student, self.sess)):
+            extra = fields.StringField()
+
+        form = StudentForm()
+        self.assertEqual(
+            set(form._fields),
+            {"full_name", "dob", "current_school", "courses", "extra"},
+        )
+        self.assertIn("dob", dir(lazy_model_form(self.Student, self.sess)))
+
+        # Attributes looked up while another thread sets the fields are found.
+        form_class = lazy_model_form(self.Student, self.sess)
+        factory = form_class.__dict__["_lazy_fields"]
+        started = threading.Event()
+
+        def slow_factory():
+            started.set()
+            time.sleep(0.1)
+            return factory()
+
+        form_class._lazy_fields = slow_factory
+        thread = threading.Thread(target=form_class)
+        thread.start()
+        started.wait()
+        self.assertTrue(hasattr(form_class, "full_name"))
+        thread.join()
+
     def test_convert_basic(self):
         self.assertRaises(TypeError, model_form, None)
         self.assertRaises(ModelConversionError, model_form, self.Course)
@@ -436,6 +1589,231 @@ class ModelFormTest(TestCase):
         F = model_form(self.Course, self.sess, exclude=["grade"], converter=converter)
         self.assertEqual(len(list(F())), 8)
 
+    def test_converter_resolution_cache(self):
+        class DateConverter(ModelConverter):
+            @converts("Date")
+            def conv_Date(self, field_args, **extra):
+                return fields.StringField(**field_args)
+
+        converter = DateConverter()
+        self.assertIn("_converter_names", DateConverter.__dict__)
+        self.assertEqual(DateConverter._converter_names["Date"], "conv_Date")
+        self.assertEqual(converter.converters["Date"], converter.conv_Date)
+
+        column = self.Course.__table__.c.grade
+        self.assertEqual(
+            converter.get_converter(column), converter.handle_integer_types
+        )
+        self.assertEqual(
+            converter._type_converters,
+            {AnotherInteger: converter.handle_integer_types},
+        )
+
+        form = model_form(self.Student, self.sess, converter=converter)()
+        assert isinstance(form.dob, fields.StringField)
+        form = model_form(self.Student, self.sess)()
+        assert isinstance(form.dob, fields.DateField)
+
+
+class ModelSchemaTest(TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        SchemaModel.metadata.create_all(bind=self.engine)
+        self.sess = sessionmaker(bind=self.engine)()
+        self.sess.add_all([Country(id=1, name="France"), Country(id=2, name="Peru")])
+        self.sess.commit()
+
+    def tearDown(self):
+        self.sess.close()
+        self.engine.dispose()
+
+    def test_round_trip(self):
+        field_args = {"country": {"get_label": "name"}, "name": {"label": "City"}}
+        schema = model_schema(City, self.sess, field_args=field_args)
+        schema = json.loads(json.dumps(schema))
+        form_class = schema_form(schema, self.sess)
+        self.assertEqual(form_class.__name__, "CityForm")
+
+        form = form_class(DummyPostData(name="Lima", population="10", country="2"))
+        self.assertEqual(
+            list(form._fields), list(model_form(City, self.sess)()._fields)
+        )
+        self.assertEqual(form.name.label.text, "City")
+        assert contains_validator(form.name, InputRequired)
+        assert contains_validator(form.name, Length)
+        self.assertEqual(form.name.validators[1].max, 50)
+        assert contains_validator(form.population, Optional)
+        self.assertEqual(form.population.default, 0)
+        self.assertIsInstance(form.country, QuerySelectField)
+        self.assertEqual(form.country.data.name, "Peru")
+        self.assertTrue(form.validate())
+
+        form = form_class(DummyPostData(name="x" * 51, country="3"))
+        self.assertFalse(form.validate())
+        self.assertEqual(set(form.errors), {"name", "country"})
+
+    def test_unsupported(self):
+        field_args = {"country": {"get_label": lambda country: country.name}}
+        self.assertRaises(
+            TypeError, model_schema, City, self.sess, field_args=field_args
+        )
+        field_args = {"name": {"validators": [Regexp("[a-z]+")]}}
+        schema = model_schema(City, self.sess, field_args=field_args)
+        form = schema_form(schema, self.sess)()
+        self.assertEqual(form.name.validators[0].regex.pattern, "[a-z]+")
+        self.assertRaises(ModelConversionError, schema_form, schema)
+
+    def test_column_defaults(self):
+        Model = declarative_base()
+
+        class Event(Model):
+            __tablename__ = "event"
+            id = Column(sqla_types.Integer, primary_key=True)
+            start = Column(sqla_types.DateTime, default=datetime.now)
+            price = Column(sqla_types.Numeric(5, 2), default=Decimal("1.50"))
+
+        self.assertRaises(TypeError, model_schema, Event)
+        schema = model_schema(Event, exclude=["price"])
+        schema = json.loads(json.dumps(schema))
+        form = schema_form(schema)()
+        self.assertEqual(form.start.default, datetime.now)
+        self.assertIsInstance(form.start.data, datetime)
+
+
+class PrefetchChoicesTest(TestCase):
+    def setUp(self):
+        # Each connection to an in-memory database has its own database.
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = create_engine(f"sqlite:///{self.path}")
+        SchemaModel.metadata.create_all(bind=self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.sess = self.Session()
+        self.sess.add_all([Country(id=1, name="France"), Country(id=2, name="Peru")])
+        self.sess.commit()
+
+    def tearDown(self):
+        self.sess.close()
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def test_prefetch(self):
+        class F(model_form(City, self.sess)):
+            other = QuerySelectMultipleField(
+                query_factory=lambda: [Country(id=3, name="Chile")],
+                get_label="name",
+            )
+            cached = QuerySelectField(
+                query_factory=lambda: self.sess.query(Country),
+                choice_cache=MemoryChoiceCache(),
+                cache_key="countries",
+            )
+            compact = QuerySelectField(
+                query_factory=lambda: self.sess.query(Country),
+                get_label="name",
+                keep_objects=False,
+                allow_blank=True,
+            )
+
+        form = F(DummyPostData(country="2", other=["3"]))
+        with count_queries(self.engine) as statements:
+            prefetch_choices(form, self.Session, max_workers=2)
+        self.assertEqual(len(statements), 2)
+        self.assertIsNone(form.cached._object_list)
+        self.assertIsNone(form.compact._object_list)
+        self.assertEqual(len(form.compact._choices), 2)
+
+        with count_queries(self.engine) as statements:
+            self.assertEqual(form.country.data.name, "Peru")
+            self.assertEqual([c.name for c in form.other.data], ["Chile"])
+            form.country()
+        # The submitted value is loaded in the session of the field's query.
+        self.assertEqual(len(statements), 1)
+        self.assertIn(form.country.data, self.sess)
+
+        city = City(name="Lyon", country=self.sess.get(Country, 1))
+        self.sess.add(city)
+        self.sess.commit()
+        form = model_form(City, self.sess)(
+            DummyPostData(name="Lima", country="1"), obj=city
+        )
+        prefetch_choices(form, self.Session)
+        self.assertTrue(form.validate(), form.errors)
+        form.populate_obj(city)
+        self.sess.commit()
+        self.assertIs(city.country, self.sess.get(Country, 1))
+
+
+@skipIf(aiosqlite is None, "aiosqlite is not installed")
+class AsyncQuerySelectFieldTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(SchemaModel.metadata.create_all)
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.sess = self.Session()
+        self.sess.add_all([Country(id=1, name="France"), Country(id=2, name="Peru")])
+        await self.sess.commit()
+
+    async def asyncTearDown(self):
+        await self.sess.close()
+        await self.engine.dispose()
+
+    async def test_load_choices(self):
+        class F(Form):
+            a = AsyncQuerySelectField(
+                session=self.Session,
+                query_factory=lambda: select(Country).order_by(Country.id),
+                get_label="name",
+                widget=LazySelect(),
+            )
+            b = AsyncQuerySelectMultipleField(
+                session=self.sess,
+                query_factory=lambda: select(Country.id, Country.name),
+                get_pk=lambda row: row.id,
+                get_label="name",
+                widget=LazySelect(),
+            )
+
+        form = F(DummyPostData(a="2", b=["1", "2"]))
+        self.assertRaises(RuntimeError, form.validate)
+        await load_form_choices(form)
+        self.assertEqual(
+            form.a(), [("1", "France", False, {}), ("2", "Peru", True, {})]
+        )
+        self.assertEqual(form.a.data.name, "Peru")
+        self.assertEqual([row.name for row in form.b.data], ["France", "Peru"])
+        self.assertTrue(form.validate())
+
+        form = F(DummyPostData(a="3"))
+        self.assertFalse(await form.a.validate_async(form))
+
+    async def test_model_form(self):
+        form_class = model_form(City, self.sess)
+        form = form_class(DummyPostData(name="Lima", country="2"))
+        self.assertIsInstance(form.country, AsyncQuerySelectField)
+        await load_form_choices(form)
+        self.assertEqual(form.country.data.name, "Peru")
+        self.assertTrue(form.validate())
+
+        # The session is not kept in schemas
+        schema = json.loads(json.dumps(model_schema(City, self.sess)))
+        form = schema_form(schema, self.Session)(DummyPostData(country="2"))
+        self.assertIs(form.country.session, self.Session)
+        await load_form_choices(form)
+        self.assertEqual(form.country.data.name, "Peru")
+
+        # The relation fields match the session the schema is loaded with
+        sync_session = sessionmaker()()
+        form = schema_form(schema, sync_session)()
+        self.assertNotIsInstance(form.country, AsyncQuerySelectField)
+        self.assertIsInstance(form.country, QuerySelectField)
+        schema = json.loads(json.dumps(model_schema(City, sync_session)))
+        form = schema_form(schema, self.Session)(DummyPostData(country="2"))
+        self.assertIsInstance(form.country, AsyncQuerySelectField)
+        await load_form_choices(form)
+        self.assertEqual(form.country.data.name, "Peru")
+
 
 class ModelFormColumnDefaultTest(TestCase):
     def setUp(self):